@@ -0,0 +1,338 @@
+"""Benchmarks for the formatting engine and the hooks of pipen-verbose
+
+Usage:
+    python benchmarks/bench_verbose.py [--save] [--quick] [-k PATTERN]
+        [--tolerance 0.25] [--baseline benchmarks/baselines.json]
+
+The `import_*` and `first_hook` benchmarks run in fresh interpreters, to
+measure what the plugin adds to the cold start of pipen.
+
+The best time of a few rounds of each benchmark is compared with the stored
+baseline, and the script exits with 1 if any of them is slower than the
+baseline by more than the tolerance. Run with `--save` to store the current
+timings as the baseline (it is machine-specific, so save it on the machine
+the benchmarks are compared on).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Any, Callable, Dict
+
+import pandas
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from pipen_verbose import (  # noqa: E402
+    PipenVerbose,
+    _format_value,
+    _log_values,
+    _pretty_format,
+    _shorten_value,
+    _summarize_input_data,
+)
+
+BASELINE_FILE = Path(__file__).parent / "baselines.json"
+# name => (setup function returning the function to time, rounds, quick)
+# The function to time could return the timing in seconds itself, e.g. when
+# it is measured in a subprocess, instead of the wall time of the call
+BENCHMARKS: Dict[str, tuple] = {}
+
+
+def benchmark(name: str, rounds: int = 5, quick: bool = True) -> Callable:
+    """Register a benchmark
+
+    Args:
+        name: The name of the benchmark
+        rounds: The number of rounds to run
+        quick: Whether to run it with `--quick`
+    """
+
+    def decorator(setup: Callable[[], Callable[[], Any]]) -> Callable:
+        BENCHMARKS[name] = (setup, rounds, quick)
+        return setup
+
+    return decorator
+
+
+def _noop_log(level, msg, *args, logger=None, **kwargs) -> None:
+    """Format the message as the loggers do, but write nothing"""
+    msg % args
+
+
+def _nested_envs(depth: int, width: int) -> dict:
+    """Make a nested envs"""
+    if depth == 0:
+        return {f"key_{i}": f"value_{i}" for i in range(width)}
+    return {
+        **{f"key_{i}": [i, str(i), {"x": i}] for i in range(width)},
+        **{f"sub_{i}": _nested_envs(depth - 1, width) for i in range(width)},
+    }
+
+
+def _indata(nrows: int, ncols: int) -> pandas.DataFrame:
+    """Make an input data frame with file-like values"""
+    return pandas.DataFrame(
+        {
+            f"col{j}": [f"/path/to/some/dir_{j}/file_{i}.txt" for i in range(nrows)]
+            for j in range(ncols)
+        }
+    )
+
+
+@benchmark("format_nested_envs")
+def bench_format_nested_envs():
+    envs = _nested_envs(4, 4)
+    return lambda: _log_values(envs, _noop_log, 10, prefix="envs.")
+
+
+@benchmark("pretty_format_nested_envs")
+def bench_pretty_format_nested_envs():
+    envs = _nested_envs(4, 4)
+    return lambda: _pretty_format(envs, compact=True, width=80)
+
+
+@benchmark("format_path_list_10k")
+def bench_format_path_list():
+    paths = [Path(f"/path/to/some/dir/file_{i}.txt") for i in range(10_000)]
+    return lambda: _format_value(paths, "in.files", 8, 10)
+
+
+def _bench_indata(nrows: int, ncols: int) -> Callable[[], Any]:
+    data = _indata(nrows, ncols)
+    return lambda: data.map(_shorten_value).to_string(
+        show_dimensions=True,
+        index=False,
+    )
+
+
+benchmark("shorten_indata_wide_1k")(lambda: _bench_indata(10, 100))
+benchmark("shorten_indata_long_100k", rounds=3)(lambda: _bench_indata(10_000, 10))
+benchmark("shorten_indata_long_1m", rounds=1, quick=False)(
+    lambda: _bench_indata(100_000, 10)
+)
+benchmark("summarize_indata_100k", rounds=3)(
+    lambda: (lambda data: lambda: _summarize_input_data(data))(_indata(10_000, 10))
+)
+benchmark("summarize_indata_1m", rounds=1, quick=False)(
+    lambda: (lambda data: lambda: _summarize_input_data(data))(_indata(100_000, 10))
+)
+
+
+def _synthetic_proc(njobs: int, plugin_opts: dict | None = None) -> Any:
+    """Make a synthetic process with jobs, as the mock of what pipen
+    passes to the hooks
+    """
+    proc = SimpleNamespace(
+        name="SyntheticProc",
+        size=njobs,
+        input=SimpleNamespace(data=_indata(njobs, 2)),
+        envs=_nested_envs(2, 4),
+        plugin_opts=plugin_opts or {},
+        pipeline=SimpleNamespace(config={}),
+        scheduler=SimpleNamespace(name="mock"),
+        template=SimpleNamespace(name="liquid"),
+        lang="bash",
+        forks=1,
+        cache=True,
+        dirsig=1,
+        output_flatten=False,
+        log=_noop_log,
+    )
+    proc.jobs = [
+        SimpleNamespace(
+            index=i,
+            proc=proc,
+            input={"col0": Path(f"/path/to/in/{i}.txt"), "col1": i},
+            output={"out": Path(f"/path/to/out/{i}.txt")},
+            log=_noop_log,
+        )
+        for i in range(njobs)
+    ]
+    return proc
+
+
+def _bench_hooks(njobs: int, plugin_opts: dict | None = None) -> Callable[[], Any]:
+    proc = _synthetic_proc(njobs, plugin_opts)
+
+    async def run_hooks():
+        plugin = PipenVerbose()
+        await plugin.on_proc_input_computed(proc)
+        await plugin.on_proc_start(proc)
+        for job in proc.jobs:
+            await plugin.on_job_init(job)
+        await plugin.on_proc_done(proc, True)
+
+    return lambda: asyncio.run(run_hooks())
+
+
+benchmark("hooks_1k_jobs")(lambda: _bench_hooks(1_000))
+benchmark("hooks_1k_jobs_spread", rounds=3)(
+    lambda: _bench_hooks(1_000, {"verbose_jobs": "spread", "verbose_jobs_n": 100})
+)
+benchmark("hooks_100k_jobs", rounds=1, quick=False)(lambda: _bench_hooks(100_000))
+
+
+def _python(code: str, *args: str) -> subprocess.CompletedProcess:
+    """Run python code in a fresh interpreter, with the bytecode cached
+    as it is for an installed package (outside of the source tree)
+    """
+    env = os.environ.copy()
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env["PYTHONPYCACHEPREFIX"] = str(Path(tempfile.gettempdir()) / "bench_verbose")
+    paths = [str(Path(__file__).parent.parent), str(Path(__file__).parent)]
+    if env.get("PYTHONPATH"):
+        paths.append(env["PYTHONPATH"])
+    env["PYTHONPATH"] = os.pathsep.join(paths)
+    return subprocess.run(
+        [sys.executable, *args, "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def _bench_import(module: str) -> Callable[[], float]:
+    def import_time() -> float:
+        # the cumulative time of the module, by `python -X importtime`,
+        # pipen_verbose is imported after pipen so only its own cost counts
+        stderr = _python("import pipen, pipen_verbose", "-X", "importtime").stderr
+        for line in stderr.splitlines():
+            if line.startswith("import time:") and line.split("|")[2].strip() == module:
+                return int(line.split("|")[1]) / 1e6
+        raise RuntimeError(f"Import time of {module} not found:\n{stderr}")
+
+    return import_time
+
+
+def _first_hook_latency() -> float:
+    """The time of the first hooks for a process, in a fresh interpreter,
+    including the lazy imports and the initialization on the first calls
+    """
+    proc = _synthetic_proc(10, {"verbose_input_summary": True})
+    plugin = PipenVerbose()
+
+    async def run_hooks():
+        await plugin.on_proc_input_computed(proc)
+        await plugin.on_proc_start(proc)
+        await plugin.on_job_init(proc.jobs[0])
+
+    loop = asyncio.new_event_loop()
+    start = perf_counter()
+    loop.run_until_complete(run_hooks())
+    elapsed = perf_counter() - start
+    loop.close()
+    return elapsed
+
+
+benchmark("import_pipen")(lambda: _bench_import("pipen"))
+benchmark("import_plugin")(lambda: _bench_import("pipen_verbose"))
+benchmark("first_hook")(
+    lambda: lambda: float(
+        _python("import bench_verbose; print(bench_verbose._first_hook_latency())")
+        .stdout.strip()
+        .splitlines()[-1]
+    )
+)
+
+
+def run(pattern: str | None, quick: bool) -> Dict[str, float]:
+    """Run the benchmarks
+
+    Args:
+        pattern: Only run the benchmarks with names containing it
+        quick: Skip the slow benchmarks
+
+    Returns:
+        The best time of the rounds of each benchmark
+    """
+    timings = {}
+    for name, (setup, rounds, is_quick) in BENCHMARKS.items():
+        if (pattern and pattern not in name) or (quick and not is_quick):
+            continue
+
+        fn = setup()
+        best = float("inf")
+        for _ in range(rounds):
+            start = perf_counter()
+            timing = fn()
+            if not isinstance(timing, float):
+                timing = perf_counter() - start
+            best = min(best, timing)
+        timings[name] = best
+        print(f"{name:<32} {best * 1000:>12.3f} ms", flush=True)
+    return timings
+
+
+def compare(
+    timings: Dict[str, float],
+    baselines: Dict[str, float],
+    tolerance: float,
+) -> bool:
+    """Compare the timings with the baselines
+
+    Args:
+        timings: The timings of the current run
+        baselines: The stored baselines
+        tolerance: The allowed relative slowdown
+
+    Returns:
+        True if no benchmark regressed
+    """
+    ok = True
+    for name, secs in timings.items():
+        if name not in baselines:
+            continue
+        ratio = secs / baselines[name]
+        status = "ok"
+        if ratio > 1 + tolerance:
+            status = "REGRESSION"
+            ok = False
+        print(f"{name:<32} {ratio:>8.2f}x baseline  {status}")
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", dest="pattern", help="Only run matching benchmarks")
+    parser.add_argument("--quick", action="store_true", help="Skip slow benchmarks")
+    parser.add_argument("--save", action="store_true", help="Save as the baseline")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="The allowed relative slowdown compared to the baseline",
+    )
+    args = parser.parse_args()
+
+    timings = run(args.pattern, args.quick)
+    baselines = (
+        json.loads(args.baseline.read_text()) if args.baseline.is_file() else {}
+    )
+    if args.save:
+        baselines.update(timings)
+        args.baseline.write_text(json.dumps(baselines, indent=2, sort_keys=True))
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not baselines:
+        print("No baseline found, run with --save to store one.")
+        return 0
+
+    print()
+    return 0 if compare(timings, baselines, args.tolerance) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,26 +2,57 @@
 
 from __future__ import annotations
 
+import asyncio
+import atexit
+import bisect
+import gc
+import hashlib
+import logging
 import numbers
-from typing import TYPE_CHECKING, Any, Callable, List, Mapping, TypeVar
+import os
+import queue
+import random
+import threading
+from collections import deque
+from datetime import datetime
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Coroutine,
+    Dict,
+    FrozenSet,
+    Generator,
+    List,
+    Mapping,
+    Tuple,
+    TypeVar,
+)
 from pathlib import Path
-from functools import singledispatch, partial
-from time import time
+from functools import singledispatch, partial, wraps
+from operator import itemgetter
+from time import perf_counter, time
 
 from rich.markup import escape
 from xqute import JobStatus
-from xqute.path import MountedPath
+from xqute.path import MountedPath, SpecLocalPath
 from pipen import plugin
-from pipen.utils import get_logger, brief_list, logger_console
+from pipen.exceptions import ProcInputValueError
+from pipen.utils import get_logger, get_mtime, brief_list, logger_console
 
 if TYPE_CHECKING:  # pragma: no cover
-    from pipen import Proc, Job
+    import signal
+    from pipen import Pipen, Proc, Job
 
 __version__ = "1.1.3"
 
 logger = get_logger("verbose", "info")
 T = TypeVar("T", list, tuple, set)
 
+# Do not check the overhead budget in the first seconds of a run,
+# when the overhead is relatively large compared to the wall time
+OVERHEAD_BUDGET_GRACE = 5.0
+
 VERBOSAL_CONFIGS = {
     # name: getter
     "scheduler": lambda proc: proc.scheduler.name,
@@ -55,6 +86,22 @@ def _format_secs(seconds: float) -> str:
     )
 
 
+def _format_bytes(nbytes: float) -> str:
+    """Format a size in bytes
+
+    Args:
+        nbytes: The size in bytes
+
+    Returns:
+        The formatted string, for example: "1.50 MiB"
+    """
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(nbytes) < 1024:
+            return f"{nbytes:.0f} {unit}" if unit == "B" else f"{nbytes:.2f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:.2f} TiB"
+
+
 @singledispatch
 def _shorten_value(value, len_cutoff: int = 20) -> str:
     """Format the values in input dataframe for debug logging
@@ -395,132 +442,3042 @@ def _log_values(
             log_fn(level, formatted, logger=logger)
 
 
-class PipenVerbose:
-    """pipen-verbose plugin: Logging some addtitional informtion for pipen"""
+def _summarize_input_data(data: Any) -> tuple[dict, dict]:
+    """Split the columns of the input data into constant and varying ones
 
-    __version__: str = __version__
-    __slots__ = ("tic",)
-    instantiate = True  # this plugin should be instantiated once
+    Each column is scanned once in a vectorized way, no job input is rendered.
 
-    def __init__(self) -> None:
-        """Constructor"""
-        self.tic: float = 0.0  # pragma: no cover
+    Args:
+        data: The input data of a process (a pandas DataFrame)
 
-    @plugin.impl
-    async def on_proc_input_computed(self, proc: Proc):
-        """Print input data on debug"""
-        if hasattr(proc.input.data, "map"):  # pragma: no cover
-            # pandas 2.1
-            data_to_show = proc.input.data.map(_shorten_value)
-        else:  # pragma: no cover
-            data_to_show = proc.input.data.applymap(_shorten_value)
+    Returns:
+        A tuple of two dicts. The first one maps the constant keys to their
+        values, and the second one maps the varying keys to a compact
+        description, with the number of distinct values, the range if the
+        column is numeric and the values of the first and the last jobs.
+    """
+    from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+    constant = {}
+    varying = {}
+    nrows = data.shape[0]
+    for key in data.columns:
+        column = data[key]
+        try:
+            ndistinct = column.nunique(dropna=False)
+        except TypeError:
+            # unhashable values, for example, lists for `files` inputs
+            ndistinct = column.map(repr).nunique(dropna=False)
+
+        first = column.iloc[0] if nrows else None
+        if ndistinct <= 1:
+            constant[key] = first
+            continue
+
+        desc = [f"{ndistinct} distinct"]
+        if is_numeric_dtype(column) and not is_bool_dtype(column):
+            desc.append(f"{column.min()} ~ {column.max()}")
+        desc.append(f"[0] {_shorten_value(first)}")
+        desc.append(f"[{nrows - 1}] {_shorten_value(column.iloc[-1])}")
+        varying[key] = ", ".join(desc)
+
+    return constant, varying
+
+
+def _digest(*parts: str) -> str:
+    """Get a short digest of the given parts"""
+    hasher = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        hasher.update(part.encode())
+        hasher.update(b"\0")
+    return hasher.hexdigest()
 
-        _log_values(
-            {"indata": data_to_show.to_string(show_dimensions=True, index=False)},
-            proc.log,
-            len(proc.name),
-            level="debug",
-        )
 
-    @plugin.impl
-    async def on_proc_start(self, proc: Proc):
-        """Print some configuration items of the process"""
-        # printing the process properties
-        # ---------------------------------
-        props = {}
-        for prop, getter in VERBOSAL_CONFIGS.items():
-            value = getter(proc) if getter else getattr(proc, prop)
-            if value is not None and value != proc.pipeline.config.get(prop, None):
-                props[prop] = value
+@singledispatch
+def _fingerprint(obj, cache: Dict[int, Tuple[Any, str]] | None = None) -> str:
+    """Get the fingerprint of an envs (sub)tree
 
-        if props['output_flatten'] is False:
-            del props['output_flatten']
+    The fingerprints of containers are computed from those of their elements
+    and can be cached by the id of the containers, so that a subtree is only
+    fingerprinted once while the envs is alive. The cache is not shared by
+    processes, since pipen copies the envs (as `Diot`) for each process.
 
-        if "size" in props and props["size"] == 1:
-            del props["size"]
+    Args:
+        obj: The object to fingerprint
+        cache: The cache of the fingerprints of the containers,
+            mapping the ids to the objects (to keep the ids valid) and
+            the fingerprints
 
-        _log_values(props, proc.log, len(proc.name), prefix="")
+    Returns:
+        The fingerprint
+    """
+    return _digest(type(obj).__name__, repr(obj))
 
-        # printing the process envs
-        # ---------------------------------
-        _log_values(proc.envs, proc.log, len(proc.name), prefix="envs.")
 
-    @plugin.impl
-    async def on_job_init(self, job: Job):
-        if job.index != 0:
-            return
+def _cached_fingerprint(fingerprint_fn: Callable) -> Callable:
+    """Cache the fingerprints of containers by their ids"""
 
-        # [01/10] in.infile
-        # ^^^^^^^^
-        jobindex_len = len(str(job.proc.size - 1)) * 2 + 4
+    def wrapper(obj, cache: Dict[int, Tuple[Any, str]] | None = None) -> str:
+        if cache is None:
+            return fingerprint_fn(obj, cache)
 
-        # printing the process input
-        # ---------------------------------
-        _log_values(job.input, job.log, len(job.proc.name) + jobindex_len, prefix="in.")
+        cached = cache.get(id(obj))
+        if cached is not None and cached[0] is obj:
+            return cached[1]
 
-        # printing the process output
-        # ---------------------------------
-        output = job.output
-        _log_values(output, job.log, len(job.proc.name) + jobindex_len, prefix="out.")
+        out = cache[id(obj)] = (obj, fingerprint_fn(obj, cache))
+        return out[1]
 
-        self.tic = time()
+    return wrapper
 
-    @plugin.impl
-    async def on_proc_done(self, proc: Proc, succeeded: bool) -> None:
-        """Log the ellapsed time for the process.
-        If the process fails, log some error messages.
+
+@_fingerprint.register(dict)
+@_cached_fingerprint
+def _(obj: dict, cache: Dict[int, Tuple[Any, str]] | None = None) -> str:
+    return _digest(
+        "dict",
+        *sorted(_digest(repr(k), _fingerprint(v, cache)) for k, v in obj.items()),
+    )
+
+
+@_fingerprint.register(list)
+@_fingerprint.register(tuple)
+@_cached_fingerprint
+def _(obj: T, cache: Dict[int, Tuple[Any, str]] | None = None) -> str:
+    return _digest(type(obj).__name__, *(_fingerprint(v, cache) for v in obj))
+
+
+@_fingerprint.register(set)
+@_cached_fingerprint
+def _(obj: set, cache: Dict[int, Tuple[Any, str]] | None = None) -> str:
+    return _digest("set", *sorted(_fingerprint(v, cache) for v in obj))
+
+
+def _sample_job_indices(
+    size: int,
+    strategy: str = "first",
+    n: int = 3,
+    seed: int | None = None,
+) -> FrozenSet[int]:
+    """Get the indices of the jobs to show the input/output for
+
+    Args:
+        size: The number of jobs of the process
+        strategy: How to pick the jobs, one of
+            - `first`: the first job
+            - `last`: the last job
+            - `ends`: the first and the last jobs
+            - `spread`: `n` evenly spaced jobs, including the first and the last
+            - `random`: a random sample of `n` jobs
+        n: The number of jobs for `spread` and `random`
+        seed: The random seed for `random`
+
+    Returns:
+        The set of job indices, so that the check for each job is O(1)
+    """
+    if size <= 0:
+        return frozenset()
+
+    if strategy == "first":
+        return frozenset({0})
+
+    if strategy == "last":
+        return frozenset({size - 1})
+
+    if strategy == "ends":
+        return frozenset({0, size - 1})
+
+    if strategy == "spread":
+        if n >= size:
+            return frozenset(range(size))
+        if n <= 1:
+            return frozenset({0})
+        return frozenset(round(i * (size - 1) / (n - 1)) for i in range(n))
+
+    if strategy == "random":
+        return frozenset(random.Random(seed).sample(range(size), min(n, size)))
+
+    raise ValueError(
+        f"Unknown strategy to show job input/output: {strategy!r}, "
+        "expected one of 'first', 'last', 'ends', 'spread' and 'random'."
+    )
+
+
+def _json_default(obj: Any) -> Any:
+    """Make the objects JSON serializable for the structured output"""
+    if isinstance(obj, Path):
+        if _is_mounted_path(obj):
+            return {"path": str(obj), "spec": str(obj.spec)}
+        return str(obj)
+
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+
+    if isinstance(obj, numbers.Integral):
+        return int(obj)
+
+    if isinstance(obj, numbers.Real):
+        return float(obj)
+
+    return str(obj)
+
+
+def _get_json_dumps() -> Callable[[Any], str]:
+    """Get the function to encode the objects into JSON strings
+
+    `orjson` is used if installed, otherwise the builtin `json`.
+    """
+    try:
+        import orjson
+    except ImportError:  # pragma: no cover
+        import json
+
+        return partial(json.dumps, default=_json_default, ensure_ascii=False)
+
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(
+            obj,
+            default=_json_default,
+            option=orjson.OPT_NON_STR_KEYS,
+        ).decode()
+
+    return dumps
+
+
+class _JsonlWriter:
+    """Write the verbose items as JSON lines to a dedicated file handler
+
+    No rich markup, escaping or pretty formatting is involved.
+
+    Args:
+        path: The path to the JSON lines file
+        pipeline: The name of the pipeline
+    """
+
+    __slots__ = ("pipeline", "logger", "handler", "dumps")
+
+    def __init__(self, path: str | Path, pipeline: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.pipeline = pipeline
+        self.dumps = _get_json_dumps()
+        self.handler = logging.FileHandler(path, encoding="utf-8")
+        self.handler.setFormatter(logging.Formatter("%(message)s"))
+        self.logger = logging.getLogger("pipen.verbose.jsonl")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.addHandler(self.handler)
+
+    def write(
+        self,
+        kind: str,
+        proc: Proc | None,
+        data: Any,
+        job: int | None = None,
+        level: str = "info",
+        timestamp: float | None = None,
+    ) -> None:
+        """Write a verbose item
+
+        Args:
+            kind: The kind of the item, e.g. `props`, `envs`, `input`
+            proc: The process, or None if the item is pipeline-level
+            data: The data of the item
+            job: The index of the job if the item is job-specific
+            level: The level of the item
+            timestamp: The time of the item, defaults to now
         """
-        proc.log(
-            "info",
-            "Time elapsed: %ss",
-            _format_secs(time() - self.tic),
-            logger=logger,
+        self.logger.info(
+            self.dumps(
+                {
+                    "time": time() if timestamp is None else timestamp,
+                    "level": level,
+                    "pipeline": self.pipeline,
+                    "proc": proc and proc.name,
+                    "job": job,
+                    "kind": kind,
+                    "data": data,
+                }
+            )
         )
 
-        if succeeded:
+    def close(self) -> None:
+        """Close the file handler"""
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+
+
+class _AsyncSink:
+    """A queue-backed sink to write the verbose records in a background thread
+
+    The records are callables with arguments (e.g. `_log_values` or
+    `proc.log`), so that both formatting and writing are done off the
+    event loop. The writer thread wakes up every `interval` seconds (or
+    when the queue is full or a flush is requested) and writes all the
+    queued records in a batch.
+
+    Args:
+        interval: The flush interval in seconds
+        buffer_size: The max number of queued records
+        policy: What to do when the queue is full, `block` to wait for the
+            writer thread, or `drop` to drop the record and count it
+    """
+
+    __slots__ = (
+        "interval",
+        "policy",
+        "queue",
+        "dropped",
+        "_wakeup",
+        "_closed",
+        "_thread",
+    )
+
+    def __init__(
+        self,
+        interval: float = 0.5,
+        buffer_size: int = 10000,
+        policy: str = "block",
+    ) -> None:
+        if policy not in ("block", "drop"):
+            raise ValueError(
+                f"Unknown backpressure policy: {policy!r}, "
+                "expected 'block' or 'drop'."
+            )
+        self.interval = interval
+        self.policy = policy
+        self.queue: queue.Queue = queue.Queue(maxsize=buffer_size)
+        self.dropped = 0
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run,
+            name="pipen-verbose-sink",
+            daemon=True,
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, fn: Callable, *args: Any, **kwargs: Any) -> None:
+        """Queue a record
+
+        Args:
+            fn: The function to write the record
+            *args: The positional arguments for the function
+            **kwargs: The keyword arguments for the function
+        """
+        if self.queue.full():
+            self._wakeup.set()
+
+        if self.policy == "drop":
+            try:
+                self.queue.put_nowait((fn, args, kwargs))
+            except queue.Full:
+                self.dropped += 1
+        else:
+            self.queue.put((fn, args, kwargs))
+
+    def _drain(self) -> None:
+        """Write all the queued records"""
+        while True:
+            try:
+                fn, args, kwargs = self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+            try:
+                fn(*args, **kwargs)
+            except Exception:  # pragma: no cover
+                logger.exception("Failed to write verbose record.")
+            finally:
+                self.queue.task_done()
+
+    def _run(self) -> None:
+        """The loop of the writer thread"""
+        while not self._closed:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self._drain()
+
+        self._drain()
+
+    def flush(self) -> None:
+        """Wait for all the queued records to be written"""
+        if self._closed:
             return
+        self._wakeup.set()
+        self.queue.join()
 
-        # print error info if any job failed
-        failed_jobs = [
-            job.index for job in proc.jobs if job._status == JobStatus.FAILED
-        ]
-        if not failed_jobs:  # pragma: no cover
-            # could be triggered by Ctrl+C and all jobs are running
+    def close(self) -> None:
+        """Write the remaining records and stop the writer thread"""
+        if self._closed:
             return
 
-        proc.log(
-            "error",
-            "[red]Failed jobs: %s[/red]",
-            brief_list(failed_jobs),
-            logger=logger,
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        atexit.unregister(self.close)
+        if self.dropped:
+            logger.warning(
+                "Dropped %s verbose records as the buffer was full.",
+                self.dropped,
+            )
+
+
+class _Archive(logging.Handler):
+    """Archive the log records of the plugin and the full (not truncated)
+    verbose items as compressed JSON lines files, rotated by size
+
+    The items are encoded, compressed and written in a background thread.
+    The files are named `<prefix>.<run>.<n>.jsonl.gz` (or `.zst`), and a new
+    file is started once the compressed size of the current one exceeds
+    `max_bytes`. The files of other runs are left untouched.
+
+    Args:
+        prefix: The prefix of the paths of the files
+        pipeline: The name of the pipeline
+        max_bytes: The max compressed size in bytes of a file
+        compression: `gzip` or `zstd` (requires `zstandard`). If None,
+            `zstd` is used if available, otherwise `gzip`
+        backups: The max number of the files of the run to keep, None to
+            keep all. The file being written is always kept, so `0` (or a
+            negative number) keeps only that one
+        run: The ID of the run in the names of the files. If None, the
+            start time, e.g. `20240101-120000-000000`
+    """
+
+    def __init__(
+        self,
+        prefix: str | Path,
+        pipeline: str,
+        max_bytes: int = 100 * 1024 * 1024,
+        compression: str | None = None,
+        backups: int | None = None,
+        run: str | None = None,
+    ) -> None:
+        super().__init__(logging.DEBUG)
+        if compression is None:
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                compression = "gzip"
+            else:  # pragma: no cover
+                compression = "zstd"
+        if compression not in ("gzip", "zstd"):
+            raise ValueError(
+                f"Unknown compression: {compression!r}, expected 'gzip' or 'zstd'."
+            )
+
+        self.prefix = Path(prefix)
+        self.prefix.parent.mkdir(parents=True, exist_ok=True)
+        self.run = run or datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        self.pipeline = pipeline
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.backups = backups
+        self.dumps = _get_json_dumps()
+        self.files: List[Path] = []
+        self.raw = None
+        self.stream = None
+        self.sink = _AsyncSink(policy="block")
+        atexit.register(self.close)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Archive a log record of the plugin"""
+        self.write("log", None, record.getMessage(), level=record.levelname.lower())
+
+    def write(
+        self,
+        kind: str,
+        proc: Proc | None,
+        data: Any,
+        job: int | None = None,
+        level: str = "info",
+    ) -> None:
+        """Archive a verbose item
+
+        Args:
+            kind: The kind of the item, e.g. `log`, `envs`, `job`
+            proc: The process, or None if the item is pipeline-level
+            data: The data of the item
+            job: The index of the job if the item is job-specific
+            level: The level of the item
+        """
+        self.sink.submit(
+            self._write,
+            {
+                "time": time(),
+                "level": level,
+                "pipeline": self.pipeline,
+                "proc": proc and proc.name,
+                "job": job,
+                "kind": kind,
+                "data": data,
+            },
         )
 
-        for j in proc.jobs:
-            if j.index == failed_jobs[0]:
-                job = j
-                break
+    def _open(self) -> None:
+        """Start a new file, and remove the oldest ones of the run if needed"""
+        suffix = "gz" if self.compression == "gzip" else "zst"
+        path = self.prefix.with_name(
+            f"{self.prefix.name}.{self.run}.{len(self.files) + 1}.jsonl.{suffix}"
+        )
+        self.files.append(path)
+        self.raw = path.open("wb")
+        if self.compression == "gzip":
+            import gzip
+
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode="wb")
         else:  # pragma: no cover
-            # should not happen
+            import zstandard
+
+            self.stream = zstandard.ZstdCompressor().stream_writer(
+                self.raw,
+                closefd=False,
+            )
+
+        if self.backups is not None:
+            # self.files[:-0] would be empty, always keep the current file
+            for oldpath in self.files[: -max(self.backups, 1)]:
+                oldpath.unlink(missing_ok=True)
+
+    def _close_stream(self) -> None:
+        """Finish the current file"""
+        self.stream.close()
+        self.raw.close()
+        self.stream = self.raw = None
+
+    def _write(self, item: Dict[str, Any]) -> None:
+        """Encode and write an item, in the writer thread"""
+        if self.stream is None:
+            self._open()
+
+        self.stream.write(self.dumps(item).encode() + b"\n")
+        if self.raw.tell() >= self.max_bytes:
+            self._close_stream()
+
+    def flush(self) -> None:
+        """Wait for the queued items to be written"""
+        self.sink.flush()
+
+    def close(self) -> None:
+        """Write the queued items and finish the current file"""
+        if self.sink._closed:
             return
 
-        stderr = (
-            await job.stderr_file.a_read_text()
-            if await job.stderr_file.a_is_file()
-            else ""
+        self.sink.close()
+        if self.stream is not None:
+            self._close_stream()
+        atexit.unregister(self.close)
+        super().close()
+
+
+class _Profiler:
+    """Profile the main process with `cProfile` and/or `tracemalloc` while
+    the processes are running
+
+    There is only one global profile. It starts when the first process
+    starts and stops when no process is active. If processes overlap, the
+    report of a process covers the segment from the start of the global
+    profile to the end of the process.
+
+    Args:
+        cprofile: Whether to profile the function calls with `cProfile`
+        tracemalloc: Whether to trace the memory allocations
+        top: The number of top functions/allocations to report
+    """
+
+    __slots__ = (
+        "cprofile",
+        "tracemalloc",
+        "top",
+        "active",
+        "started",
+        "profile",
+        "snapshots",
+        "_own_tracing",
+    )
+
+    def __init__(
+        self,
+        cprofile: bool = True,
+        tracemalloc: bool = False,
+        top: int = 10,
+    ) -> None:
+        self.cprofile = cprofile
+        self.tracemalloc = tracemalloc
+        self.top = top
+        # names of the processes being profiled
+        self.active: set[str] = set()
+        # when the global profile started
+        self.started = 0.0
+        self.profile = None
+        # proc name => the snapshot of tracemalloc when the proc starts
+        self.snapshots: dict[str, Any] = {}
+        self._own_tracing = False
+
+    def start(self, procname: str) -> None:
+        """Start profiling for a process
+
+        Args:
+            procname: The name of the process
+        """
+        if not self.active:
+            self.started = perf_counter()
+
+        if not self.active and self.cprofile:
+            import cProfile
+
+            self.profile = cProfile.Profile()
+            try:
+                self.profile.enable()
+            except ValueError:  # pragma: no cover
+                # Another profiling tool is already active
+                logger.warning("Failed to start cProfile, skipping.")
+                self.profile = None
+
+        if self.tracemalloc:
+            import tracemalloc
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._own_tracing = True
+            self.snapshots[procname] = tracemalloc.take_snapshot()
+
+        self.active.add(procname)
+
+    def stop(self, procname: str) -> Tuple[float, bytes | None, List[str], List[str]]:
+        """Stop profiling for a process
+
+        Args:
+            procname: The name of the process
+
+        Returns:
+            The start time of the segment, the marshalled profile stats,
+            the summary of the top functions by cumulative time and the
+            summary of the top allocations since the process started.
+        """
+        import marshal
+
+        self.active.discard(procname)
+        stats = None
+        top_funcs = []
+        if self.profile is not None:
+            # create_stats() disables the profile
+            self.profile.create_stats()
+            stats = marshal.dumps(self.profile.stats)
+            top_funcs = [
+                f"{ct:.3f}s {tt:.3f}s {nc} {func} ({file}:{line})"
+                for (file, line, func), (_, nc, tt, ct, _) in sorted(
+                    self.profile.stats.items(),
+                    key=lambda item: item[1][3],
+                    reverse=True,
+                )[: self.top]
+            ]
+            if self.active:
+                self.profile.enable()
+            else:
+                self.profile = None
+
+        top_allocs = []
+        before = self.snapshots.pop(procname, None)
+        if before is not None:
+            import tracemalloc
+
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__),)
+            )
+            top_allocs = [
+                str(stat) for stat in snapshot.compare_to(before, "lineno")[: self.top]
+            ]
+            if not self.active and self._own_tracing:
+                tracemalloc.stop()
+                self._own_tracing = False
+
+        return self.started, stats, top_funcs, top_allocs
+
+    def close(self) -> None:
+        """Stop profiling, for example, when the pipeline is interrupted"""
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile = None
+
+        if self._own_tracing:
+            import tracemalloc
+
+            tracemalloc.stop()
+            self._own_tracing = False
+
+        self.active.clear()
+        self.snapshots.clear()
+
+
+def _get_rss() -> int:
+    """Get the resident set size (RSS) of the current process in bytes
+
+    `psutil` is used if installed, otherwise `/proc/self/statm` (Linux).
+    Falls back to the peak RSS from `resource` on other platforms.
+    """
+    try:
+        import psutil
+    except ImportError:
+        pass
+    else:  # pragma: no cover
+        return psutil.Process().memory_info().rss
+
+    try:
+        with open("/proc/self/statm") as fstatm:
+            return int(fstatm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):  # pragma: no cover
+        import resource
+        import sys
+
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # in bytes on macOS, in kilobytes on Linux
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class _MemoryTracker:
+    """Track the memory (RSS) of the main process
+
+    The samples are kept in a ring buffer so that the tracking itself does
+    not leak, while the peak and the memory at the start of each process
+    are tracked separately.
+
+    Args:
+        max_samples: The max number of samples to keep
+        with_gc: Whether to also sample the `gc` generation counts
+    """
+
+    __slots__ = ("samples", "with_gc", "peak", "peak_proc", "proc_start")
+
+    def __init__(self, max_samples: int = 1000, with_gc: bool = False) -> None:
+        # (time, rss, proc name, gc counts)
+        self.samples: deque = deque(maxlen=max_samples)
+        self.with_gc = with_gc
+        self.peak = 0
+        self.peak_proc: str | None = None
+        # proc name => rss when the process started
+        self.proc_start: dict[str, int] = {}
+
+    def sample(self, procname: str | None) -> int:
+        """Take a sample
+
+        Args:
+            procname: The name of the process that is running, if any
+
+        Returns:
+            The RSS in bytes
+        """
+        rss = _get_rss()
+        self.samples.append(
+            (time(), rss, procname, gc.get_count() if self.with_gc else None)
         )
-        kwargs = {"limit": job.index + 1, "logger": logger}
-        for line in stderr.splitlines():
-            job.log("error", "[red]%s[/red]", escape(line), **kwargs)
+        if rss > self.peak:
+            self.peak = rss
+            self.peak_proc = procname
+        return rss
+
+
+class _CacheMissExplainer:
+    """Explain why the jobs of a process are not cached
+
+    The stored signature of each job is compared with the current one,
+    in a similar way as pipen checks the cache, but the reason is recorded
+    instead of being logged. Each job is explained in its `on_job_init`,
+    before pipen checks the cache and clears the outputs, so the jobs are
+    explained as concurrently as pipen prepares them (`submission_batch`).
+
+    Args:
+        dirsig: The depth to check the mtime of directories
+        envs_changed: Whether the envs of the process changed since the
+            last run, to tell a changed envs from a changed script
+    """
+
+    __slots__ = ("dirsig", "envs_changed", "reasons")
+
+    def __init__(self, dirsig: int = 1, envs_changed: bool = False) -> None:
+        self.dirsig = dirsig
+        self.envs_changed = envs_changed
+        # job index => reason
+        self.reasons: dict[int, str] = {}
+
+    async def explain(self, job: Job) -> None:
+        """Explain why the job is not cached, in case it is not
+
+        Args:
+            job: The job
+        """
+        try:
+            reason = await self._explain(job)
+        except Exception:
+            reason = "invalid signature"
+        self.reasons[job.index] = reason or "unknown"
+
+    async def _explain(self, job: Job) -> str | None:
+        """Get the reason why the job is not cached"""
+        from simpleconf import Config
+
+        if not await job.rc_file.a_is_file():
+            return "no previous run"
+
+        if await job.get_rc() != 0:
+            return "previous run failed"
+
+        if not await job.signature_file.a_is_file():
+            return "missing signature"
+
+        signature = Config.load(
+            await job.signature_file.a_read_text(),
+            loader="tomls",
+        )
+        if (
+            signature.input.type != job.proc.input.type
+            or signature.output.type != job._output_types
+        ):
+            return "changed input/output types"
+
+        if await get_mtime(job.script_file, 0) > signature.ctime + 1e-3:
+            return "changed envs" if self.envs_changed else "changed script"
+
+        for key, intype in job.proc.input.type.items():
+            sig_value = signature.input.data.get(key)
+            value = job.input[key]
+            if intype == "var":
+                if sig_value != value:
+                    return f"changed input ({key})"
+                continue
+
+            if value is None or sig_value is None:
+                if value is not sig_value:
+                    return f"changed input ({key})"
+                continue
+
+            paths = value if intype in ("files", "dirs") else [value]
+            sig_paths = sig_value if intype in ("files", "dirs") else [sig_value]
+            if sig_paths != [str(path.spec) for path in paths]:
+                return f"changed input ({key})"
+
+            for path in paths:
+                if await get_mtime(path.spec, self.dirsig) > signature.ctime + 1e-3:
+                    return f"newer input file ({key})"
+
+        for key, outtype in job._output_types.items():
+            sig_value = signature.output.data.get(key)
+            if outtype == "var":
+                if sig_value != job.output[key]:
+                    return f"changed output ({key})"
+                continue
+
+            if sig_value != str(job.output[key].spec):
+                return f"changed output ({key})"
+
+            if not await job.output[key].spec.a_exists():
+                return f"missing output ({key})"
+
+        return None
+
+    def summary(self) -> List[Tuple[str, List[int]]]:
+        """Group the jobs by the reasons
+
+        Returns:
+            The reasons and the sorted indices of the jobs, with the most frequent
+            reasons first
+        """
+        groups: dict[str, List[int]] = {}
+        for index, reason in sorted(self.reasons.items()):
+            groups.setdefault(reason, []).append(index)
+
+        return sorted(groups.items(), key=lambda item: -len(item[1]))
+
+
+class _InputPreflight:
+    """Check the input files and directories of the processes before their
+    jobs are created
+
+    The paths are deduplicated and checked concurrently. The paths checked
+    fine are cached across the processes of the pipeline, but the problems
+    are not, since a missing input could be created by an upstream process
+    in the meantime.
+
+    Args:
+        concurrency: The max number of paths to check concurrently
+    """
 
-        job.log("error", "[red]-----------------------------------[/red]", **kwargs)
+    __slots__ = ("semaphore", "fine")
+
+    def __init__(self, concurrency: int = 32) -> None:
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # (spec path, whether a directory is expected) checked fine
+        self.fine: set[Tuple[str, bool]] = set()
+
+    async def _check_path(self, spec: Path, isdir: bool) -> str | None:
+        """Check a path
+
+        Args:
+            spec: The spec path
+            isdir: Whether a directory is expected
+
+        Returns:
+            The problem, or None if the path is fine
+        """
+        async with self.semaphore:
+            if not await spec.a_exists():
+                return "missing"
+            if isdir and not await spec.a_is_dir():
+                return "not a directory"
+            if isinstance(spec, SpecLocalPath) and not os.access(spec, os.R_OK):
+                return "not readable"
+            return None
+
+    async def check(
+        self,
+        proc: Proc,
+    ) -> Dict[Tuple[str, str], Tuple[List[int], str]]:
+        """Check the input files and directories of a process
+
+        Args:
+            proc: The process, with the input computed
+
+        Returns:
+            The input key and the problem => the indices of the jobs and
+            an example path
+        """
+        from pipen.job import _process_input_file_or_dir
+
+        # (spec, isdir) => [(key, job index)]
+        paths: dict[Tuple[str, bool], List[Tuple[str, int]]] = {}
+        specs: dict[str, Path] = {}
+        for key, intype in proc.input.type.items():
+            if intype == "var":
+                continue
+
+            isdir = intype in ("dir", "dirs")
+            for index, value in enumerate(proc.input.data[key]):
+                values = value if isinstance(value, (list, tuple)) else [value]
+                for val in values:
+                    try:
+                        spec = _process_input_file_or_dir(key, intype, val).spec
+                    except Exception:
+                        # invalid values are left to pipen to complain
+                        continue
+                    specs[str(spec)] = spec
+                    paths.setdefault((str(spec), isdir), []).append((key, index))
+
+        unchecked = [path for path in paths if path not in self.fine]
+        checked = await asyncio.gather(
+            *(self._check_path(specs[spec], isdir) for spec, isdir in unchecked)
+        )
+        problems = dict(zip(unchecked, checked))
+        self.fine.update(path for path, problem in problems.items() if problem is None)
+
+        out: dict[Tuple[str, str], Tuple[List[int], str]] = {}
+        for path, problem in problems.items():
+            if problem is None:
+                continue
+            for key, index in paths[path]:
+                indices, _ = out.setdefault((key, problem), ([], path[0]))
+                if not indices or indices[-1] != index:
+                    indices.append(index)
+
+        for indices, _ in out.values():
+            indices.sort()
+        return out
+
+
+class _OutputScan:
+    """Check the outputs of the finished jobs of a process
+
+    The file/dir outputs are stat-ed concurrently, and the ones that are
+    missing, empty (zero-byte files or empty directories) or older than the
+    submission of the last attempt of the job are counted.
+
+    Args:
+        concurrency: The max number of outputs to check concurrently
+        dirsig: The depth to check the mtime of directories
+    """
+
+    __slots__ = ("semaphore", "dirsig", "started")
+
+    def __init__(self, concurrency: int = 32, dirsig: int = 1) -> None:
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.dirsig = dirsig
+        # job index => the submission time of the last attempt
+        self.started: dict[int, float] = {}
+
+    async def _stat(self, spec: Path, isdir: bool) -> Tuple[int, float] | None:
+        """Get the size and the mtime of an output
+
+        Args:
+            spec: The spec path of the output
+            isdir: Whether the output is a directory
+
+        Returns:
+            The size (the number of entries for a directory) and the mtime,
+            or None if the output is missing
+        """
+        async with self.semaphore:
+            if not await spec.a_exists():
+                return None
+            if not isdir:
+                stat = await spec.a_stat()
+                return stat.st_size, stat.st_mtime
+            size = len([path async for path in spec.a_iterdir()])
+            return size, await get_mtime(spec, self.dirsig)
+
+    async def scan(
+        self,
+        jobs: List[Job],
+    ) -> Tuple[
+        Dict[Tuple[str, str], List[int]],
+        Dict[str, Tuple[bool, int, float] | None],
+    ]:
+        """Check the outputs of the jobs
+
+        Args:
+            jobs: The finished jobs
+
+        Returns:
+            The output key and the problem => the indices of the jobs, and
+            the index of the outputs, i.e. the spec path => whether it is a
+            directory, the size and the mtime (None if missing)
+        """
+        targets = [
+            (job, key, outtype == "dir", job.output[key].spec)
+            for job in jobs
+            for key, outtype in job._output_types.items()
+            if outtype != "var"
+        ]
+        stats = await asyncio.gather(
+            *(self._stat(spec, isdir) for _, _, isdir, spec in targets)
+        )
+
+        problems: dict[Tuple[str, str], List[int]] = {}
+        index: dict[str, Tuple[bool, int, float] | None] = {}
+        for (job, key, isdir, spec), stat in zip(targets, stats):
+            index[str(spec)] = None if stat is None else (isdir, *stat)
+            if stat is None:
+                problem = "missing"
+            elif stat[0] == 0:
+                problem = "empty"
+            elif stat[1] < self.started.get(job.index, 0.0) - 1.0:
+                # allow 1s for the filesystems with coarse mtime
+                problem = "older than the job start"
+            else:
+                continue
+            problems.setdefault((key, problem), []).append(job.index)
+
+        for indices in problems.values():
+            indices.sort()
+        return problems, index
+
+
+def _percentiles(
+    values: List[float],
+    percents: Tuple[int, ...] = (50, 90, 99),
+) -> Dict[str, float]:
+    """Get the percentiles (nearest-rank), the max and the total of values
+
+    Args:
+        values: The values, not empty
+        percents: The percents to get the percentiles for
+
+    Returns:
+        A dict like `{"p50": ..., "p90": ..., "max": ..., "total": ...}`
+    """
+    values = sorted(values)
+    out = {
+        f"p{percent}": values[max(0, -(-len(values) * percent // 100) - 1)]
+        for percent in percents
+    }
+    out["max"] = values[-1]
+    out["total"] = sum(values)
+    return out
+
+
+class _PrepTimer:
+    """Time the preparation of the jobs of a process, from the output
+    computation to the script ready (when `on_job_init` is called), and the
+    rendering of the scripts
+
+    The `render` methods of the output and script templates of the process
+    are wrapped on the instances until `restore()` is called.
+
+    Args:
+        proc: The process
+    """
+
+    __slots__ = ("started", "prep", "render", "_templates")
+
+    def __init__(self, proc: Proc) -> None:
+        # job index => the start of the preparation
+        self.started: dict[int, float] = {}
+        # job index => the duration of the preparation
+        self.prep: dict[int, float] = {}
+        # job index => the duration of the script rendering
+        self.render: dict[int, float] = {}
+        self._templates: list = []
+        # the output could be a list of templates, one for each key
+        outputs = proc.output
+        if not isinstance(outputs, (list, tuple)):
+            outputs = [outputs]
+        for output in outputs:
+            self._wrap(output, None)
+        self._wrap(proc.script, self.render)
+
+    def _wrap(self, template: Any, durations: dict | None) -> None:
+        """Wrap the render method of a template to time it
+
+        Args:
+            template: The template
+            durations: Where to save the durations of the rendering
+        """
+        render = getattr(template, "render", None)
+        if render is None:
+            return
+
+        @wraps(render)
+        def timed_render(data: Mapping[str, Any] | None = None) -> str:
+            index = data["job"]["index"]
+            start = perf_counter()
+            self.started.setdefault(index, start)
+            try:
+                return render(data)
+            finally:
+                if durations is not None:
+                    durations[index] = perf_counter() - start
+
+        template.render = timed_render
+        self._templates.append(template)
+
+    def done(self, index: int) -> float | None:
+        """Mark the script of a job ready
+
+        Args:
+            index: The index of the job
+
+        Returns:
+            The duration of the preparation, or None if its start is unknown
+        """
+        start = self.started.pop(index, None)
+        if start is None:
+            return None
+        self.prep[index] = perf_counter() - start
+        return self.prep[index]
+
+    def restore(self) -> None:
+        """Restore the render methods of the templates"""
+        for template in self._templates:
+            del template.render
+        self._templates.clear()
+
+    def summary(self, top: int = 3) -> Dict[str, Any]:
+        """Summarize the durations
+
+        Args:
+            top: The number of the slowest jobs to include
+
+        Returns:
+            The percentiles of the durations of the preparation and the
+            rendering, and the slowest jobs to prepare
+        """
+        slowest = sorted(self.prep, key=self.prep.__getitem__, reverse=True)
+        return {
+            "jobs": len(self.prep),
+            "prep": _percentiles(list(self.prep.values())),
+            "render": (
+                _percentiles(list(self.render.values())) if self.render else None
+            ),
+            "slowest": {index: self.prep[index] for index in slowest[:top]},
+        }
+
+
+class _RetryStats:
+    """Account the retries of the jobs of a process and the time spent
+    on the failed attempts
+
+    A retry is counted when an attempt of a job starts after a failed one,
+    since whether a failed job is retried is decided by the scheduler later.
+    """
+
+    __slots__ = ("started", "failed", "retries", "wasted")
+
+    def __init__(self) -> None:
+        # job index => the start time of the current attempt
+        self.started: dict[int, float] = {}
+        # indices of the jobs with the last attempt failed
+        self.failed: set[int] = set()
+        # job index => the number of retries
+        self.retries: dict[int, int] = {}
+        # job-seconds spent on the failed attempts
+        self.wasted = 0.0
+
+    def start(self, index: int) -> bool:
+        """Mark the start of an attempt of a job
+
+        Args:
+            index: The index of the job
+
+        Returns:
+            Whether the attempt is a retry
+        """
+        self.started[index] = time()
+        if index not in self.failed:
+            return False
+        self.failed.discard(index)
+        self.retries[index] = self.retries.get(index, 0) + 1
+        return True
+
+    def finish(self, index: int) -> float | None:
+        """Mark the end of an attempt of a job
+
+        Args:
+            index: The index of the job
+
+        Returns:
+            The duration of the attempt, or None if the start is unknown
+        """
+        start = self.started.pop(index, None)
+        return None if start is None else time() - start
+
+    def fail(self, index: int) -> float | None:
+        """Mark a failed attempt of a job
+
+        Args:
+            index: The index of the job
+
+        Returns:
+            The duration of the attempt, or None if the start is unknown
+        """
+        duration = self.finish(index)
+        if duration is not None:
+            self.wasted += duration
+        self.failed.add(index)
+        return duration
+
+    def summary(self) -> Dict[str, Any]:
+        """Summarize the retries
+
+        Returns:
+            The number of retried jobs, the total number of retries, the
+            distribution (number of retries => number of jobs) and the
+            job-seconds spent on the failed attempts
+        """
+        distribution: dict[int, int] = {}
+        for count in self.retries.values():
+            distribution[count] = distribution.get(count, 0) + 1
+
+        return {
+            "jobs": len(self.retries),
+            "retries": sum(self.retries.values()),
+            "distribution": dict(sorted(distribution.items())),
+            "wasted": self.wasted,
+        }
+
+
+class _RateLimiter:
+    """Limit the rate of the verbose lines by levels with token buckets,
+    and account the suppressed details of the processes
+
+    A bucket refills at `rate` tokens (lines) per second up to `burst`.
+    A block of lines is allowed if the bucket has enough tokens (or is full,
+    for blocks larger than the burst), otherwise it is suppressed. Warnings
+    and errors are never limited.
+    """
+
+    UNLIMITED = frozenset(("warning", "error", "critical"))
+
+    __slots__ = ("buckets", "suppressed")
+
+    def __init__(self, rates: Mapping[str, float], burst: float | None = None):
+        now = perf_counter()
+        # level => [rate, capacity, tokens, last refill]
+        self.buckets: dict[str, list] = {}
+        for level, rate in rates.items():
+            level = level.lower()
+            if level not in self.UNLIMITED:
+                capacity = burst or rate
+                self.buckets[level] = [rate, capacity, capacity, now]
+        # proc name => section => [count, times, unit]
+        self.suppressed: dict[str, dict[str, list]] = {}
+
+    def allow(self, level: str, cost: int = 1) -> bool:
+        """Take the tokens for a block of lines, if available
+
+        Args:
+            level: The level of the lines
+            cost: The number of lines
+
+        Returns:
+            Whether the lines are allowed to be logged
+        """
+        bucket = self.buckets.get(level)
+        if bucket is None:
+            return True
+
+        rate, capacity, tokens, last = bucket
+        now = perf_counter()
+        tokens = min(capacity, tokens + (now - last) * rate)
+        bucket[3] = now
+        if tokens < min(cost, capacity):
+            bucket[2] = tokens
+            return False
+        # could go into debt with a block larger than the burst
+        bucket[2] = tokens - cost
+        return True
+
+    def suppress(
+        self,
+        procname: str,
+        section: str,
+        count: int,
+        unit: str = "keys",
+    ) -> None:
+        """Account a suppressed block of a process
+
+        Args:
+            procname: The name of the process
+            section: The section of the block, e.g. `envs`
+            count: The number of items in the block
+            unit: The unit of the items
+        """
+        entry = self.suppressed.setdefault(procname, {}).setdefault(
+            section, [0, 0, unit]
+        )
+        entry[0] += count
+        entry[1] += 1
+
+    def summary(self, procname: str) -> str | None:
+        """Pop the summary of the suppressed blocks of a process
+
+        Args:
+            procname: The name of the process
+
+        Returns:
+            A line like `envs: 42 keys, in: 30 keys of 10 job(s)`, or None
+            if nothing was suppressed
+        """
+        sections = self.suppressed.pop(procname, None)
+        if not sections:
+            return None
+        return ", ".join(
+            f"{section}: {count} {unit}"
+            + (f" of {times} job(s)" if section in ("in", "out") else "")
+            for section, (count, times, unit) in sections.items()
+        )
+
+
+async def _path_size(
+    path: Path,
+    budget: List[int] | None = None,
+    isdir: bool | None = None,
+) -> int | None:
+    """Get the size of a file, or the total size of the files in a directory
+
+    Args:
+        path: The path
+        budget: A one-element list with the number of the filesystem calls
+            (is_dir, stat or listing) allowed, decreased by the calls.
+            None for no limit.
+        isdir: Whether the path is a directory, None to check it
+
+    Returns:
+        The size in bytes, 0 if the path does not exist, or None if the budget
+        runs out before the size is known
+    """
+    if isdir is None:
+        if budget is not None:
+            if budget[0] <= 0:
+                return None
+            budget[0] -= 1
+        isdir = await path.a_is_dir()
+
+    if budget is not None:
+        if budget[0] <= 0:
+            return None
+        budget[0] -= 1
+
+    try:
+        if not isdir:
+            return (await path.a_stat()).st_size
+        total = 0
+        async for subpath in path.a_iterdir():
+            size = await _path_size(subpath, budget)
+            if size is None:
+                return None
+            total += size
+        return total
+    except FileNotFoundError:
+        return 0
+
+
+class _OutputWatchdog:
+    """Watch the sizes of the stdout/stderr files (and optionally the output
+    directories) of the running jobs
+
+    The files of all the running jobs are checked in turn, with at most
+    `max_stats` filesystem calls per sweep, and each file is warned at most
+    once for being too large or growing too fast. An output directory is
+    skipped in a sweep if walking it takes more calls than what is left.
+
+    Args:
+        max_size: The max size in bytes of a file
+        max_rate: The max growth rate in bytes per second of a file
+        max_stats: The max number of filesystem calls per sweep
+        with_outdir: Whether to also watch the output directories
+    """
+
+    __slots__ = (
+        "max_size",
+        "max_rate",
+        "max_stats",
+        "with_outdir",
+        "jobs",
+        "order",
+        "sizes",
+        "warned",
+    )
+
+    def __init__(
+        self,
+        max_size: int | None = None,
+        max_rate: float | None = None,
+        max_stats: int = 100,
+        with_outdir: bool = False,
+    ) -> None:
+        self.max_size = max_size
+        self.max_rate = max_rate
+        self.max_stats = max_stats
+        self.with_outdir = with_outdir
+        # (proc name, job index) => job
+        self.jobs: dict[Tuple[str, int], Job] = {}
+        # the keys of the jobs in the order to check
+        self.order: deque = deque()
+        # (proc name, job index, file) => (size, time)
+        self.sizes: dict[Tuple[str, int, str], Tuple[int, float]] = {}
+        self.warned: set = set()
+
+    def add(self, job: Job) -> None:
+        """Start watching a job"""
+        key = (job.proc.name, job.index)
+        if key not in self.jobs:
+            self.order.append(key)
+        self.jobs[key] = job
+
+    def remove(self, job: Job) -> None:
+        """Stop watching a job"""
+        key = (job.proc.name, job.index)
+        self.jobs.pop(key, None)
+        for name in ("stdout", "stderr", "outdir"):
+            self.sizes.pop((*key, name), None)
+
+    async def sweep(self) -> List[Tuple[Job, str, str, int, float | None]]:
+        """Check the files of the running jobs in turn
+
+        Returns:
+            The job, the file, the kind of the warning ("size" or "rate"),
+            the size and the growth rate of the files to warn about
+        """
+        files = []
+        outdirs = []
+        # the calls reserved: a stat for each file, and at least a listing
+        # for each output directory
+        reserved = 0
+        visited = set()
+        while self.order:
+            key = self.order.popleft()
+            if key not in self.jobs:
+                continue
+            job = self.jobs[key]
+            with_outdir = self.with_outdir and job.outdir is not None
+            if key in visited or reserved + 2 + with_outdir > self.max_stats:
+                self.order.appendleft(key)
+                break
+
+            visited.add(key)
+            self.order.append(key)
+            reserved += 2 + with_outdir
+            files.append((job, "stdout", job.stdout_file))
+            files.append((job, "stderr", job.stderr_file))
+            if with_outdir:
+                outdirs.append((job, "outdir", job.outdir))
+
+        budget = [self.max_stats]
+        sizes = await asyncio.gather(
+            *(_path_size(path, budget, isdir=False) for _, _, path in files)
+        )
+        # the output directories share the rest of the budget, walked one by
+        # one so that the budget is not spread over unfinished walks
+        for _, _, path in outdirs:
+            sizes.append(await _path_size(path, budget, isdir=True))
+        now = time()
+        out = []
+        for (job, name, _), size in zip(files + outdirs, sizes):
+            if size is None:
+                continue
+            key = (job.proc.name, job.index, name)
+            last = self.sizes.get(key)
+            self.sizes[key] = (size, now)
+            rate = (
+                None
+                if last is None or now <= last[1]
+                else (size - last[0]) / (now - last[1])
+            )
+            if (
+                self.max_size is not None
+                and size > self.max_size
+                and (key, "size") not in self.warned
+            ):
+                self.warned.add((key, "size"))
+                out.append((job, name, "size", size, rate))
+            if (
+                self.max_rate is not None
+                and rate is not None
+                and rate > self.max_rate
+                and (key, "rate") not in self.warned
+            ):
+                self.warned.add((key, "rate"))
+                out.append((job, name, "rate", size, rate))
+
+        return out
+
+
+def _format_labels(**labels: Any) -> str:
+    """Format the labels of a metric in the Prometheus text format"""
+    return ",".join(
+        '%s="%s"'
+        % (
+            key,
+            str(value)
+            .replace("\\", "\\\\")
+            .replace('"', '\\"')
+            .replace("\n", "\\n"),
+        )
+        for key, value in labels.items()
+    )
+
+
+class _Metrics:
+    """Keep the metrics of a pipeline in memory and write them to a file
+    in the Prometheus text format (for the textfile collector of
+    node_exporter)
+
+    The updates only increment the counters. The file is rewritten
+    atomically (to a temporary file, then renamed) by `write()`, which is
+    called periodically, so that the elapsed time keeps moving while no jobs
+    change their states.
+
+    Args:
+        path: The path of the file
+        pipeline: The name of the pipeline
+        buckets: The upper bounds of the buckets of the job durations
+    """
+
+    BUCKETS = (1, 5, 10, 30, 60, 300, 600, 1800, 3600, 7200, 21600, 86400)
+
+    __slots__ = (
+        "path",
+        "pipeline",
+        "buckets",
+        "started",
+        "jobs",
+        "durations",
+        "running",
+    )
+
+    def __init__(
+        self,
+        path: str | Path,
+        pipeline: str,
+        buckets: Tuple[float, ...] = BUCKETS,
+    ) -> None:
+        self.path = Path(path)
+        self.pipeline = pipeline
+        self.buckets = tuple(sorted(buckets))
+        self.started = time()
+        # (proc name, state) => count
+        self.jobs: dict[Tuple[str, str], int] = {}
+        # proc name => [count of each bucket (not cumulative) ..., sum]
+        self.durations: dict[str, list] = {}
+        self.running = True
+
+    def inc(self, proc: str, state: str) -> None:
+        """Increment the count of the jobs of a process in a state"""
+        key = (proc, state)
+        self.jobs[key] = self.jobs.get(key, 0) + 1
+
+    def observe(self, proc: str, duration: float) -> None:
+        """Record the duration of an attempt of a job of a process"""
+        counts = self.durations.get(proc)
+        if counts is None:
+            counts = self.durations[proc] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, duration)] += 1
+        counts[-1] += duration
+
+    def render(self) -> str:
+        """Render the metrics in the Prometheus text format"""
+        pipeline = _format_labels(pipeline=self.pipeline)
+        lines = [
+            "# HELP pipen_jobs_total The number of jobs entering the states.",
+            "# TYPE pipen_jobs_total counter",
+        ]
+        for (proc, state), count in self.jobs.items():
+            labels = _format_labels(pipeline=self.pipeline, proc=proc, state=state)
+            lines.append(f"pipen_jobs_total{{{labels}}} {count}")
+
+        lines.append(
+            "# HELP pipen_job_duration_seconds The durations of the job attempts."
+        )
+        lines.append("# TYPE pipen_job_duration_seconds histogram")
+        for proc, counts in self.durations.items():
+            labels = _format_labels(pipeline=self.pipeline, proc=proc)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                lines.append(
+                    f'pipen_job_duration_seconds_bucket{{{labels},le="{bound}"}} '
+                    f"{cumulative}"
+                )
+            lines.append(f"pipen_job_duration_seconds_sum{{{labels}}} {counts[-1]}")
+            lines.append(f"pipen_job_duration_seconds_count{{{labels}}} {cumulative}")
+
+        lines.extend(
+            [
+                "# HELP pipen_pipeline_elapsed_seconds The elapsed time of the "
+                "pipeline.",
+                "# TYPE pipen_pipeline_elapsed_seconds gauge",
+                f"pipen_pipeline_elapsed_seconds{{{pipeline}}} "
+                f"{time() - self.started:.3f}",
+                "# HELP pipen_pipeline_running Whether the pipeline is running.",
+                "# TYPE pipen_pipeline_running gauge",
+                f"pipen_pipeline_running{{{pipeline}}} {int(self.running)}",
+            ]
+        )
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> None:
+        """Write the metrics to the file atomically"""
+        tmpfile = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmpfile.write_text(self.render())
+        os.replace(tmpfile, self.path)
+
+
+class _ByteCounter(logging.Filter):
+    """Count the bytes of the log text produced by the plugin"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.nbytes = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        self.nbytes += len(record.getMessage().encode())
+        return True
+
+
+class _SyncTimer:
+    """Await a coroutine, timing only its synchronous steps
+
+    The time the coroutine is suspended (e.g. waiting for I/O) is left out.
+    The steps run in the event loop thread one at a time, so the times of
+    concurrent coroutines do not overlap and can be summed.
+
+    Args:
+        coro: The coroutine
+    """
+
+    __slots__ = ("coro", "elapsed")
+
+    def __init__(self, coro: Coroutine) -> None:
+        self.coro = coro
+        self.elapsed = 0.0
+
+    def __await__(self) -> Generator[Any, Any, Any]:
+        value, error = None, None
+        while True:
+            start = perf_counter()
+            try:
+                if error is None:
+                    future = self.coro.send(value)
+                else:
+                    future = self.coro.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.elapsed += perf_counter() - start
+
+            value, error = None, None
+            try:
+                value = yield future
+            except GeneratorExit:
+                self.coro.close()
+                raise
+            except BaseException as exc:
+                # e.g. asyncio.CancelledError
+                error = exc
+
+
+def _tracked(hook: Callable) -> Callable:
+    """Track the running hook of the plugin and the process it is running for,
+    so that the stalls of the event loop can be attributed, and account the
+    time spent in the synchronous steps of the hook
+
+    Args:
+        hook: The async process/job hook implementation of the plugin
+
+    Returns:
+        The wrapped hook
+    """
+
+    @wraps(hook)
+    async def wrapper(self: PipenVerbose, obj: Any, *args: Any, **kwargs: Any):
+        # obj is either a Proc or a Job object
+        running = (hook.__name__, getattr(obj, "proc", obj).name, perf_counter())
+        # hooks could run concurrently, e.g. on_job_init for a batch of jobs
+        self.running[id(running)] = running
+        timer = _SyncTimer(hook(self, obj, *args, **kwargs))
+        try:
+            return await timer
+        finally:
+            end = perf_counter()
+            del self.running[id(running)]
+            self.last_hook = (*running, end)
+            stats = self.overhead.setdefault(hook.__name__, [0, 0.0])
+            stats[0] += 1
+            stats[1] += timer.elapsed
+            self.overhead_total += timer.elapsed
+            if self.overhead_budget is not None and not self.degraded:
+                self._check_overhead_budget(end)
+
+    return wrapper
+
+
+class PipenVerbose:
+    """pipen-verbose plugin: Logging some addtitional informtion for pipen"""
+
+    __version__: str = __version__
+    __slots__ = (
+        "tic",
+        "shown_jobs",
+        "envs_refs",
+        "envs_ref_count",
+        "jsonl",
+        "sink",
+        "running",
+        "last_hook",
+        "active_proc",
+        "lag_monitor",
+        "started",
+        "overhead",
+        "overhead_total",
+        "overhead_budget",
+        "degraded",
+        "byte_counter",
+        "profiler",
+        "memory",
+        "memory_timer",
+        "cache_explainers",
+        "retry_stats",
+        "retry_summaries",
+        "watchdog",
+        "watchdog_timer",
+        "metrics",
+        "metrics_timer",
+        "archive",
+        "preflight",
+        "output_scans",
+        "prep_timers",
+        "limiter",
+    )
+    instantiate = True  # this plugin should be instantiated once
+
+    def __init__(self) -> None:
+        """Constructor"""
+        self.tic: float = 0.0  # pragma: no cover
+        # proc name => indices of the jobs to show input/output
+        self.shown_jobs: dict[str, FrozenSet[int]] = {}  # pragma: no cover
+        # fingerprint of an envs item => (reference ID, proc name)
+        self.envs_refs: dict[str, Tuple[str, str]] = {}  # pragma: no cover
+        # the number of reference IDs given
+        self.envs_ref_count: int = 0  # pragma: no cover
+        # the writer for the structured output, if enabled
+        self.jsonl: _JsonlWriter | None = None  # pragma: no cover
+        # the sink to write the records in background, if enabled
+        self.sink: _AsyncSink | None = None  # pragma: no cover
+        # id => (hook name, proc name, start) of the running hooks
+        self.running: dict[int, tuple] = {}  # pragma: no cover
+        # (hook name, proc name, start, end) of the last finished hook
+        self.last_hook: tuple | None = None  # pragma: no cover
+        # the name of the process that is running
+        self.active_proc: str | None = None  # pragma: no cover
+        self.lag_monitor: asyncio.Task | None = None  # pragma: no cover
+        # when the pipeline started to run
+        self.started: float = 0.0  # pragma: no cover
+        # hook name => [number of calls, time spent]
+        self.overhead: dict[str, list] = {}  # pragma: no cover
+        self.overhead_total: float = 0.0  # pragma: no cover
+        # the max percentage of the wall time the plugin could spend
+        self.overhead_budget: float | None = None  # pragma: no cover
+        # whether only summaries are logged, when the budget is exceeded
+        self.degraded: bool = False  # pragma: no cover
+        self.byte_counter = _ByteCounter()  # pragma: no cover
+        # the profiler of the main process, created when needed
+        self.profiler: _Profiler | None = None  # pragma: no cover
+        # the memory tracker of the main process, if enabled
+        self.memory: _MemoryTracker | None = None  # pragma: no cover
+        self.memory_timer: asyncio.Task | None = None  # pragma: no cover
+        # proc name => the explainer of the cache misses, if enabled
+        self.cache_explainers: dict[str, _CacheMissExplainer] = {}  # pragma: no cover
+        # proc name => the retry stats of the running process
+        self.retry_stats: dict[str, _RetryStats] = {}  # pragma: no cover
+        # proc name => the summary of the retries of the done process
+        self.retry_summaries: dict[str, Dict[str, Any]] = {}  # pragma: no cover
+        self.watchdog: _OutputWatchdog | None = None  # pragma: no cover
+        self.watchdog_timer: asyncio.Task | None = None  # pragma: no cover
+        self.metrics: _Metrics | None = None  # pragma: no cover
+        self.metrics_timer: asyncio.Task | None = None  # pragma: no cover
+        self.archive: _Archive | None = None  # pragma: no cover
+        # shared by the processes to cache the checked paths
+        self.preflight: _InputPreflight | None = None  # pragma: no cover
+        # proc name => the scan of the outputs, if enabled
+        self.output_scans: dict[str, _OutputScan] = {}  # pragma: no cover
+        # proc name => the timer of the job preparation, if enabled
+        self.prep_timers: dict[str, _PrepTimer] = {}  # pragma: no cover
+        # the limiter of the rate of the verbose lines, if enabled
+        self.limiter: _RateLimiter | None = None  # pragma: no cover
+
+    def _log(self, fn: Callable, *args: Any, **kwargs: Any) -> None:
+        """Write a verbose record, via the sink if enabled
+
+        Args:
+            fn: The function to write the record, e.g. `_log_values`
+            *args: The positional arguments for the function
+            **kwargs: The keyword arguments for the function
+        """
+        if self.sink is not None:
+            if self.jsonl is not None and fn == self.jsonl.write:
+                # the time of the event, not when the sink writes it
+                kwargs.setdefault("timestamp", time())
+            self.sink.submit(fn, *args, **kwargs)
+        else:
+            fn(*args, **kwargs)
+
+    def _allow(
+        self,
+        proc: Proc,
+        section: str,
+        count: int,
+        level: str = "info",
+        unit: str = "keys",
+    ) -> bool:
+        """Check if a block of details of a process is allowed by the rate
+        limiter, and account it if suppressed
+
+        Args:
+            proc: The process
+            section: The section of the block, e.g. `envs`
+            count: The number of lines (items) of the block
+            level: The level of the block
+            unit: The unit of the items
+
+        Returns:
+            Whether the block is allowed to be logged
+        """
+        if (
+            self.limiter is None
+            or not logger.isEnabledFor(logging.getLevelName(level.upper()))
+            or self.limiter.allow(level, count)
+        ):
+            return True
+        self.limiter.suppress(proc.name, section, count, unit)
+        return False
+
+    def _check_overhead_budget(self, now: float) -> None:
+        """Switch to the summary-only mode if the overhead exceeds the budget
+
+        Args:
+            now: The current time (by `perf_counter()`)
+        """
+        wall = now - self.started
+        if wall < OVERHEAD_BUDGET_GRACE:
+            return
+
+        if self.overhead_total * 100.0 > self.overhead_budget * wall:
+            self.degraded = True
+            self._log(
+                logger.warning,
+                "Overhead (%.2f%% of wall time) exceeds the budget (%s%%), "
+                "only summaries will be logged.",
+                self.overhead_total * 100.0 / wall,
+                self.overhead_budget,
+            )
+
+    @plugin.impl
+    async def on_start(self, pipen: Pipen):
+        """Reset the states for a new run"""
+        opts = pipen.config.plugin_opts
+        self.active_proc = None
+        self.shown_jobs.clear()
+        self.envs_refs.clear()
+        self.envs_ref_count = 0
+        self.retry_stats.clear()
+        self.retry_summaries.clear()
+        self.preflight = None
+        self.started = perf_counter()
+        self.overhead = {
+            hook: [0, 0.0]
+            for hook in (
+                "on_proc_input_computed",
+                "on_proc_start",
+                "on_job_init",
+                "on_proc_done",
+            )
+        }
+        self.overhead_total = 0.0
+        self.overhead_budget = opts.get("verbose_overhead_budget", None)
+        self.degraded = False
+        self.byte_counter.nbytes = 0
+        logger.logger.addFilter(self.byte_counter)
+
+        rate_limit = opts.get("verbose_rate_limit", None)
+        if rate_limit is not None:
+            self.limiter = _RateLimiter(
+                (
+                    rate_limit
+                    if isinstance(rate_limit, dict)
+                    else {"info": rate_limit, "debug": rate_limit}
+                ),
+                burst=opts.get("verbose_rate_burst", None),
+            )
+
+        jsonl = opts.get("verbose_jsonl", None)
+        if jsonl:
+            if jsonl is True:
+                jsonl = Path(str(pipen.workdir)) / "verbose.jsonl"
+            self.jsonl = _JsonlWriter(jsonl, pipen.name)
+            self.jsonl.logger.addFilter(self.byte_counter)
+
+        archive = opts.get("verbose_archive", None)
+        if archive:
+            if archive is True:
+                archive = Path(str(pipen.workdir)) / "verbose.archive"
+            self.archive = _Archive(
+                archive,
+                pipen.name,
+                max_bytes=opts.get("verbose_archive_max_bytes", 100 * 1024 * 1024),
+                compression=opts.get("verbose_archive_compression", None),
+                backups=opts.get("verbose_archive_backups", None),
+            )
+            logger.logger.addHandler(self.archive)
+
+        if opts.get("verbose_async", False):
+            self.sink = _AsyncSink(
+                interval=opts.get("verbose_async_interval", 0.5),
+                buffer_size=opts.get("verbose_async_buffer", 10000),
+                policy=opts.get("verbose_async_policy", "block"),
+            )
+
+        if opts.get("verbose_memory", False):
+            self.memory = _MemoryTracker(
+                max_samples=opts.get("verbose_memory_samples", 1000),
+                with_gc=opts.get("verbose_memory_gc", False),
+            )
+            self.memory.sample(None)
+            self.memory_timer = asyncio.get_running_loop().create_task(
+                self._sample_memory(opts.get("verbose_memory_interval", 10.0))
+            )
+
+        watchdog_size = opts.get("verbose_watchdog_size", None)
+        watchdog_rate = opts.get("verbose_watchdog_rate", None)
+        if watchdog_size is not None or watchdog_rate is not None:
+            self.watchdog = _OutputWatchdog(
+                max_size=watchdog_size,
+                max_rate=watchdog_rate,
+                max_stats=opts.get("verbose_watchdog_max_stats", 100),
+                with_outdir=opts.get("verbose_watchdog_outdir", False),
+            )
+            self.watchdog_timer = asyncio.get_running_loop().create_task(
+                self._watch_outputs(opts.get("verbose_watchdog_interval", 10.0))
+            )
+
+        metrics = opts.get("verbose_metrics", None)
+        if metrics:
+            if metrics is True:
+                metrics = Path(str(pipen.workdir)) / "verbose.prom"
+            self.metrics = _Metrics(
+                metrics,
+                pipen.name,
+                buckets=opts.get("verbose_metrics_buckets", _Metrics.BUCKETS),
+            )
+            self.metrics_timer = asyncio.get_running_loop().create_task(
+                self._write_metrics(opts.get("verbose_metrics_interval", 15.0))
+            )
+
+        lag_threshold = opts.get("verbose_lag_threshold", None)
+        if lag_threshold is not None:
+            self.running.clear()
+            self.last_hook = None
+            self.lag_monitor = asyncio.get_running_loop().create_task(
+                self._monitor_lag(
+                    lag_threshold,
+                    opts.get("verbose_lag_interval", 0.1),
+                )
+            )
+
+    async def _sample_memory(self, interval: float) -> None:
+        """Sample the memory of the main process periodically
+
+        Args:
+            interval: The interval in seconds
+        """
+        while True:
+            await asyncio.sleep(interval)
+            self.memory.sample(self.active_proc)
+
+    async def _write_metrics(self, interval: float) -> None:
+        """Write the metrics periodically
+
+        Args:
+            interval: The interval in seconds
+        """
+        while True:
+            await asyncio.sleep(interval)
+            self.metrics.write()
+
+    async def _watch_outputs(self, interval: float) -> None:
+        """Check the outputs of the running jobs periodically
+
+        Args:
+            interval: The interval in seconds
+        """
+        while True:
+            await asyncio.sleep(interval)
+            for job, name, kind, size, rate in await self.watchdog.sweep():
+                if self.jsonl is not None:
+                    self._log(
+                        self.jsonl.write,
+                        "watchdog",
+                        job.proc,
+                        {"file": name, "kind": kind, "size": size, "rate": rate},
+                        job=job.index,
+                        level="warning",
+                    )
+                elif kind == "size":
+                    self._log(
+                        job.log,
+                        "warning",
+                        "%s is %s, larger than %s",
+                        name,
+                        _format_bytes(size),
+                        _format_bytes(self.watchdog.max_size),
+                        limit=job.index + 1,
+                        logger=logger,
+                    )
+                else:
+                    self._log(
+                        job.log,
+                        "warning",
+                        "%s grows at %s/s, faster than %s/s",
+                        name,
+                        _format_bytes(rate),
+                        _format_bytes(self.watchdog.max_rate),
+                        limit=job.index + 1,
+                        logger=logger,
+                    )
+
+    async def _monitor_lag(self, threshold: float, interval: float) -> None:
+        """Measure the latency of the event loop and log the stalls
+
+        Args:
+            threshold: The min stall duration in seconds to log
+            interval: The interval in seconds to measure the latency
+        """
+        while True:
+            start = perf_counter()
+            await asyncio.sleep(interval)
+            end = perf_counter()
+            lag = end - start - interval
+            if lag < threshold:
+                continue
+
+            if self.running:
+                # blame the longest-running one
+                hook, procname, _ = min(self.running.values(), key=itemgetter(2))
+                where = f"while running {hook} for {procname}"
+                if len(self.running) > 1:
+                    where += f" (and {len(self.running) - 1} other hook(s))"
+            elif self.last_hook is not None and self.last_hook[3] >= start:
+                hook, procname, hook_start, hook_end = self.last_hook
+                where = (
+                    f"in {hook} for {procname} "
+                    f"(took {_format_secs(hook_end - hook_start)}s)"
+                )
+            else:
+                where = (
+                    "outside pipen-verbose hooks "
+                    f"(active process: {self.active_proc})"
+                )
+
+            self._log(
+                logger.warning,
+                "Event loop blocked for %ss %s",
+                _format_secs(lag),
+                where,
+            )
+
+    @plugin.impl
+    def on_proc_shutdown(self, proc: Proc, sig: signal.Signals) -> None:
+        """Write the queued records when shutting down (e.g. by Ctrl+C)"""
+        if self.sink is not None:
+            self.sink.flush()
+        if self.archive is not None:
+            self.archive.flush()
+
+    @plugin.impl
+    async def on_complete(self, pipen: Pipen, succeeded: bool):
+        """Report the overhead, write the remaining records and close
+        the outputs
+        """
+        if self.lag_monitor is not None:
+            self.lag_monitor.cancel()
+            self.lag_monitor = None
+
+        if self.watchdog is not None:
+            self.watchdog_timer.cancel()
+            self.watchdog_timer = None
+            self.watchdog = None
+
+        if self.metrics is not None:
+            self.metrics_timer.cancel()
+            self.metrics_timer = None
+            self.metrics.running = False
+            self.metrics.write()
+            self.metrics = None
+
+        self._report_overhead(
+            pipen.config.plugin_opts.get("verbose_overhead_report", False)
+        )
+        self._report_retries(None)
+        if self.memory is not None:
+            self.memory_timer.cancel()
+            self.memory_timer = None
+            self.memory.sample(None)
+            self._report_memory(None, self.memory.peak, self.memory.peak_proc)
+            self.memory = None
+        if self.profiler is not None:  # pragma: no cover
+            # processes not done, e.g. interrupted
+            self.profiler.close()
+            self.profiler = None
+
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
+
+        if self.archive is not None:
+            logger.logger.removeHandler(self.archive)
+            self.archive.close()
+            self.archive = None
+
+        self.limiter = None
+        logger.logger.removeFilter(self.byte_counter)
+        if self.jsonl is not None:
+            self.jsonl.logger.removeFilter(self.byte_counter)
+            self.jsonl.close()
+            self.jsonl = None
+
+    def _report_memory(
+        self,
+        proc: Proc | None,
+        rss: int,
+        peak_proc: str | None = None,
+        delta: int | None = None,
+    ) -> None:
+        """Report the memory of the main process
+
+        Args:
+            proc: The process, or None to report the peak at the end of the
+                pipeline
+            rss: The RSS (or the peak RSS for the pipeline) in bytes
+            peak_proc: The process the peak fell in
+            delta: The change of the RSS during the process
+        """
+        counts = gc.get_count() if self.memory.with_gc else None
+        if self.jsonl is not None:
+            self._log(
+                self.jsonl.write,
+                "memory",
+                proc,
+                {"rss": rss, "delta": delta, "peak_proc": peak_proc, "gc": counts},
+            )
+        elif proc is not None:
+            self._log(
+                proc.log,
+                "info",
+                "Memory: %s (%s%s)%s",
+                _format_bytes(rss),
+                "+" if delta >= 0 else "-",
+                _format_bytes(abs(delta)),
+                f", gc counts: {counts}" if counts else "",
+                logger=logger,
+            )
+        else:
+            self._log(
+                logger.info,
+                "Peak memory: %s (%s)%s",
+                _format_bytes(rss),
+                f"during {peak_proc}" if peak_proc else "outside processes",
+                f", gc counts: {counts}" if counts else "",
+            )
+
+    def _report_overhead(self, report: bool) -> None:
+        """Report the time spent in the hooks and the bytes of log text
+
+        Args:
+            report: Whether to log the report at the `info` level, otherwise
+                it is logged at the `debug` level (always written to the
+                JSON lines output if enabled)
+        """
+        wall = perf_counter() - self.started
+        if self.jsonl is not None:
+            self._log(
+                self.jsonl.write,
+                "overhead",
+                None,
+                {
+                    "hooks": {
+                        hook: {"calls": calls, "time": secs}
+                        for hook, (calls, secs) in self.overhead.items()
+                    },
+                    "total": self.overhead_total,
+                    "wall": wall,
+                    "bytes": self.byte_counter.nbytes,
+                    "degraded": self.degraded,
+                },
+            )
+            return
+
+        log = logger.info if report else logger.debug
+        for hook, (calls, secs) in self.overhead.items():
+            self._log(
+                log,
+                "Overhead of %s: %ss (%s calls)",
+                hook,
+                _format_secs(secs),
+                calls,
+            )
+        self._log(
+            log,
+            "Overhead: %ss (%.2f%% of wall time %ss), %s bytes of log text",
+            _format_secs(self.overhead_total),
+            self.overhead_total * 100.0 / wall if wall > 0 else 0.0,
+            _format_secs(wall),
+            self.byte_counter.nbytes,
+        )
+
+    def _get_preflight(self, proc: Proc) -> _InputPreflight:
+        """Get the input preflight shared by the processes"""
+        if self.preflight is None:
+            self.preflight = _InputPreflight(
+                proc.plugin_opts.get("verbose_preflight_concurrency", 32)
+            )
+        return self.preflight
+
+    async def _preflight(self, proc: Proc, fail: bool) -> None:
+        """Check the input files and directories of the process, and report
+        the problems grouped by the input keys
+
+        Args:
+            proc: The process
+            fail: Whether to fail the process if there are problems
+        """
+        problems = await self._get_preflight(proc).check(proc)
+        if not problems:
+            return
+
+        level = "error" if fail else "warning"
+        if self.jsonl is not None:
+            self._log(
+                self.jsonl.write,
+                "preflight",
+                proc,
+                [
+                    {"key": key, "problem": problem, "jobs": jobs, "example": example}
+                    for (key, problem), (jobs, example) in problems.items()
+                ],
+                level=level,
+            )
+        else:
+            for (key, problem), (jobs, example) in problems.items():
+                self._log(
+                    proc.log,
+                    level,
+                    "Input preflight: in.%s %s in %s job(s) (%s), e.g. %s",
+                    key,
+                    problem,
+                    len(jobs),
+                    brief_list(jobs[:10]),
+                    example,
+                    logger=logger,
+                )
+
+        if fail:
+            raise ProcInputValueError(
+                f"[{proc.name}] Input preflight failed: "
+                + ", ".join(
+                    f"in.{key} {problem} in {len(jobs)} job(s)"
+                    for (key, problem), (jobs, _) in problems.items()
+                )
+            )
+
+    @plugin.impl
+    @_tracked
+    async def on_proc_input_computed(self, proc: Proc):
+        """Print input data on debug"""
+        self.active_proc = proc.name
+        cprofile = proc.plugin_opts.get("verbose_profile", False)
+        tracemalloc = proc.plugin_opts.get("verbose_tracemalloc", False)
+        if cprofile or tracemalloc:
+            if self.profiler is None:
+                self.profiler = _Profiler(
+                    cprofile=cprofile,
+                    tracemalloc=tracemalloc,
+                    top=proc.plugin_opts.get("verbose_profile_top", 10),
+                )
+            self.profiler.start(proc.name)
+
+        if self.memory is not None:
+            self.memory.proc_start[proc.name] = self.memory.sample(proc.name)
+
+        preflight = proc.plugin_opts.get("verbose_preflight", False)
+        if preflight:
+            await self._preflight(proc, preflight == "fail")
+
+        if self.degraded:
+            return
+
+        if self.jsonl is not None:
+            if proc.plugin_opts.get("verbose_input_summary", False) and proc.size > 1:
+                constant, varying = _summarize_input_data(proc.input.data)
+                self._log(
+                    self.jsonl.write,
+                    "input_summary",
+                    proc,
+                    {"constant": constant, "varying": varying},
+                )
+            return
+
+        # rendering the input data is costly, skip it unless it is logged
+        if logger.isEnabledFor(logging.DEBUG) and self._allow(
+            proc, "indata", proc.size, level="debug", unit="rows"
+        ):
+            if hasattr(proc.input.data, "map"):  # pragma: no cover
+                # pandas 2.1
+                data_to_show = proc.input.data.map(_shorten_value)
+            else:  # pragma: no cover
+                data_to_show = proc.input.data.applymap(_shorten_value)
+
+            self._log(
+                _log_values,
+                {"indata": data_to_show.to_string(show_dimensions=True, index=False)},
+                proc.log,
+                len(proc.name),
+                level="debug",
+            )
+
+        if proc.plugin_opts.get("verbose_input_summary", False) and proc.size > 1:
+            # constant keys are logged with their values, varying ones with
+            # the number of distinct values and examples
+            constant, varying = _summarize_input_data(proc.input.data)
+            if not self._allow(proc, "input summary", len(constant) + len(varying)):
+                return
+            self._log(
+                _log_values,
+                {**constant, **varying},
+                proc.log,
+                len(proc.name),
+                # not to be confused with the input of the jobs
+                prefix="in(summary).",
+            )
+
+    @plugin.impl
+    @_tracked
+    async def on_proc_start(self, proc: Proc):
+        """Print some configuration items of the process"""
+        # printing the process properties
+        # ---------------------------------
+        props = {}
+        for prop, getter in VERBOSAL_CONFIGS.items():
+            value = getter(proc) if getter else getattr(proc, prop)
+            if value is not None and value != proc.pipeline.config.get(prop, None):
+                props[prop] = value
+
+        if props['output_flatten'] is False:
+            del props['output_flatten']
+
+        if "size" in props and props["size"] == 1:
+            del props["size"]
+
+        # the jobs to show input/output for
+        self.shown_jobs[proc.name] = _sample_job_indices(
+            proc.size,
+            proc.plugin_opts.get("verbose_jobs", "first"),
+            proc.plugin_opts.get("verbose_jobs_n", 3),
+            proc.plugin_opts.get("verbose_jobs_seed", None),
+        )
+
+        if self.memory is not None:
+            self.memory.sample(proc.name)
+
+        # the fingerprints of the envs containers of this process, reused by
+        # the cache miss explainer and the dedup of the envs. pipen copies
+        # the envs for each process, so the containers are not shared
+        # across processes, and the fingerprints are not kept after this hook.
+        fp_cache: Dict[int, Tuple[Any, str]] = {}
+        if proc.plugin_opts.get("verbose_cache_miss", False) and (
+            proc.pipeline.config.cache if proc.cache is None else proc.cache
+        ):
+            # save the fingerprint of the envs to tell if it changes next time
+            envs_fp = _fingerprint(proc.envs, fp_cache)
+            envs_fp_file = proc.workdir / "proc.verbose.envs"
+            old_envs_fp = (
+                await envs_fp_file.a_read_text()
+                if await envs_fp_file.a_is_file()
+                else envs_fp
+            )
+            await proc.workdir.a_mkdir(parents=True, exist_ok=True)
+            await envs_fp_file.a_write_text(envs_fp)
+            self.cache_explainers[proc.name] = _CacheMissExplainer(
+                dirsig=(
+                    proc.pipeline.config.dirsig
+                    if proc.dirsig is None
+                    else proc.dirsig
+                ),
+                envs_changed=old_envs_fp != envs_fp,
+            )
+
+        if proc.plugin_opts.get("verbose_prep", False):
+            self.prep_timers[proc.name] = _PrepTimer(proc)
+
+        if proc.plugin_opts.get("verbose_output_scan", False):
+            self.output_scans[proc.name] = _OutputScan(
+                concurrency=proc.plugin_opts.get(
+                    "verbose_output_scan_concurrency", 32
+                ),
+                dirsig=(
+                    proc.pipeline.config.dirsig
+                    if proc.dirsig is None
+                    else proc.dirsig
+                ),
+            )
+
+        if self.archive is not None and proc.envs:
+            self.archive.write("envs", proc, proc.envs)
+
+        if self.degraded:
+            return
+
+        if self.jsonl is not None:
+            self._log(self.jsonl.write, "props", proc, props)
+            self._log(self.jsonl.write, "envs", proc, proc.envs)
+            return
+
+        if self._allow(proc, "props", len(props)):
+            self._log(_log_values, props, proc.log, len(proc.name), prefix="")
+
+        # printing the process envs
+        # ---------------------------------
+        if not self._allow(proc, "envs", len(proc.envs)):
+            return
+
+        if proc.plugin_opts.get("verbose_envs_dedup", False):
+            self._log_envs_dedup(proc, fp_cache)
+        else:
+            self._log(_log_values, proc.envs, proc.log, len(proc.name), prefix="envs.")
+
+    def _log_envs_dedup(
+        self,
+        proc: Proc,
+        fp_cache: Dict[int, Tuple[Any, str]],
+    ) -> None:
+        """Log the envs of the process, with the items that have been logged
+        by previous processes referred to by their reference IDs
+
+        Args:
+            proc: The process
+            fp_cache: The cache of the fingerprints of the envs containers
+        """
+        new_envs: dict[str, Any] = {}
+        new_fps: List[str] = []
+        # reference ID => keys
+        shared: dict[Tuple[str, str], List[str]] = {}
+        self._dedup_envs(proc.envs, "", fp_cache, new_envs, new_fps, shared)
+
+        if new_envs:
+            self.envs_ref_count += 1
+            ref = (f"E{self.envs_ref_count}", proc.name)
+            for fp in new_fps:
+                self.envs_refs[fp] = ref
+
+            self._log(proc.log, "info", "envs (#%s):", ref[0], logger=logger)
+            self._log(_log_values, new_envs, proc.log, len(proc.name), prefix="envs.")
+
+        for (ref_id, procname), keys in shared.items():
+            self._log(
+                proc.log,
+                "info",
+                "envs: %s same as #%s (%s)",
+                ", ".join(keys),
+                ref_id,
+                procname,
+                logger=logger,
+            )
+
+    def _dedup_envs(
+        self,
+        envs: Mapping[str, Any],
+        path: str,
+        fp_cache: Dict[int, Tuple[Any, str]],
+        new_envs: dict[str, Any],
+        new_fps: List[str],
+        shared: dict[Tuple[str, str], List[str]],
+    ) -> None:
+        """Split the items of (a subtree of) the envs into the new ones and
+        the ones logged before
+
+        A dict that is new as a whole but has subtrees logged before is
+        descended into, so that only the keys that differ are logged.
+
+        Args:
+            envs: The envs or a subtree of it
+            path: The dotted path of the subtree, with a trailing dot
+            fp_cache: The cache of the fingerprints of the envs containers
+            new_envs: The new items to fill, by dotted paths
+            new_fps: The fingerprints of the new items to fill
+            shared: The dotted paths of the items logged before to fill,
+                by reference IDs
+        """
+        for key, value in envs.items():
+            keypath = f"{path}{key}"
+            fp = _digest(keypath, _fingerprint(value, fp_cache))
+            if fp in self.envs_refs:
+                shared.setdefault(self.envs_refs[fp], []).append(keypath)
+                continue
+
+            if isinstance(value, dict) and value:
+                sub_envs: dict[str, Any] = {}
+                sub_fps: List[str] = []
+                sub_shared: dict[Tuple[str, str], List[str]] = {}
+                self._dedup_envs(
+                    value, f"{keypath}.", fp_cache, sub_envs, sub_fps, sub_shared
+                )
+                # the subtrees can be referred to by later processes, even if
+                # the dict is logged as a whole
+                new_fps.extend(sub_fps)
+                if sub_shared:
+                    new_envs.update(sub_envs)
+                    new_fps.append(fp)
+                    for ref, keys in sub_shared.items():
+                        shared.setdefault(ref, []).extend(keys)
+                    continue
+
+            new_envs[keypath] = value
+            new_fps.append(fp)
+
+    @plugin.impl
+    @_tracked
+    async def on_job_init(self, job: Job):
+        prep_timer = self.prep_timers.get(job.proc.name)
+        if prep_timer is not None:
+            prep = prep_timer.done(job.index)
+            if self.archive is not None:
+                self.archive.write(
+                    "prep",
+                    job.proc,
+                    {"prep": prep, "render": prep_timer.render.get(job.index)},
+                    job=job.index,
+                )
+
+        if job.index == 0:
+            self.tic = time()
+
+        if self.metrics is not None:
+            self.metrics.inc(job.proc.name, "init")
+
+        explainer = self.cache_explainers.get(job.proc.name)
+        if explainer is not None:
+            # before pipen checks the cache and clears the outputs
+            await explainer.explain(job)
+
+        if self.archive is not None:
+            self.archive.write(
+                "job",
+                job.proc,
+                {"input": job.input, "output": job.output},
+                job=job.index,
+            )
+
+        if self.degraded or job.index not in self.shown_jobs.get(job.proc.name, ()):
+            return
+
+        if self.jsonl is not None:
+            self._log(self.jsonl.write, "input", job.proc, job.input, job=job.index)
+            self._log(self.jsonl.write, "output", job.proc, job.output, job=job.index)
+            return
+
+        allow_input = self._allow(job.proc, "in", len(job.input))
+        allow_output = self._allow(job.proc, "out", len(job.output))
+        if not allow_input and not allow_output:
+            return
+
+        # [01/10] in.infile
+        # ^^^^^^^^
+        jobindex_len = len(str(job.proc.size - 1)) * 2 + 4
+        # job.log only logs the first few jobs by default
+        log_fn = partial(job.log, limit=job.index + 1)
+
+        # printing the process input
+        # ---------------------------------
+        if allow_input:
+            self._log(
+                _log_values,
+                job.input,
+                log_fn,
+                len(job.proc.name) + jobindex_len,
+                prefix="in.",
+            )
+
+        # printing the process output
+        # ---------------------------------
+        if allow_output:
+            self._log(
+                _log_values,
+                job.output,
+                log_fn,
+                len(job.proc.name) + jobindex_len,
+                prefix="out.",
+            )
+
+    async def _report_profile(self, proc: Proc) -> None:
+        """Stop profiling for the process, save the reports to the process
+        workdir and log the top functions and allocations
+        """
+        segment_start, stats, top_funcs, top_allocs = self.profiler.stop(proc.name)
+        if not self.profiler.active:
+            self.profiler = None
+
+        segment = (
+            f"{_format_secs(segment_start - self.started)} ~ "
+            f"{_format_secs(perf_counter() - self.started)}"
+        )
+        if stats is not None:
+            prof_file = proc.workdir / "verbose.prof"
+            await prof_file.a_write_bytes(stats)
+            self._log(
+                proc.log,
+                "info",
+                "Profile (%s) saved to %s, top functions "
+                "(cumtime, tottime, ncalls, function):",
+                segment,
+                prof_file,
+                logger=logger,
+            )
+            for line in top_funcs:
+                self._log(proc.log, "info", "  %s", escape(line), logger=logger)
+
+        if top_allocs:
+            alloc_file = proc.workdir / "verbose.tracemalloc.txt"
+            await alloc_file.a_write_text("\n".join(top_allocs) + "\n")
+            self._log(
+                proc.log,
+                "info",
+                "Top allocations (%s) saved to %s:",
+                segment,
+                alloc_file,
+                logger=logger,
+            )
+            for line in top_allocs:
+                self._log(proc.log, "info", "  %s", escape(line), logger=logger)
+
+    @plugin.impl
+    @_tracked
+    async def on_job_submitted(self, job: Job):
+        """Record the submission time of the attempt of the job"""
+        # on_job_started is called when the polling finds the job running,
+        # could be after a fast job writes its outputs
+        scan = self.output_scans.get(job.proc.name)
+        if scan is not None:
+            scan.started[job.index] = time()
+
+    @plugin.impl
+    @_tracked
+    async def on_job_started(self, job: Job):
+        """Record the start time of the attempt of the job"""
+        stats = self.retry_stats.setdefault(job.proc.name, _RetryStats())
+        retry = stats.start(job.index)
+        if self.watchdog is not None:
+            self.watchdog.add(job)
+        if self.metrics is not None:
+            self.metrics.inc(job.proc.name, "started")
+            if retry:
+                self.metrics.inc(job.proc.name, "retried")
+
+    @plugin.impl
+    @_tracked
+    async def on_job_failed(self, job: Job):
+        """Account the failed attempt of the job"""
+        self._job_failed(job)
+
+    def _job_failed(self, job: Job) -> None:
+        """Account the failed attempt of the job"""
+        duration = self.retry_stats.setdefault(job.proc.name, _RetryStats()).fail(
+            job.index
+        )
+        if self.watchdog is not None:
+            self.watchdog.remove(job)
+        if self.metrics is not None:
+            self.metrics.inc(job.proc.name, "failed")
+            if duration is not None:
+                self.metrics.observe(job.proc.name, duration)
+
+    @plugin.impl
+    @_tracked
+    async def on_job_succeeded(self, job: Job):
+        """Forget the start time of the attempt of the job"""
+        if job._status == JobStatus.FAILED:
+            # pipen's on_job_succeeded runs first and fails the job if any
+            # output is not generated, without calling on_job_failed
+            self._job_failed(job)
+            return
+
+        stats = self.retry_stats.get(job.proc.name)
+        duration = None if stats is None else stats.finish(job.index)
+        if self.watchdog is not None:
+            self.watchdog.remove(job)
+        if self.metrics is not None:
+            self.metrics.inc(job.proc.name, "succeeded")
+            if duration is not None:
+                self.metrics.observe(job.proc.name, duration)
+
+    @plugin.impl
+    @_tracked
+    async def on_job_killed(self, job: Job):
+        """Stop watching the outputs of the job"""
+        if self.watchdog is not None:  # pragma: no cover
+            self.watchdog.remove(job)
+        if self.metrics is not None:  # pragma: no cover
+            self.metrics.inc(job.proc.name, "killed")
+
+    def _report_retries(self, proc: Proc | None) -> None:
+        """Log the retries of the process, or of the whole pipeline
+
+        Args:
+            proc: The process, or None to report the retries of all the
+                processes at the end of the pipeline
+        """
+        if proc is not None:
+            stats = self.retry_stats.pop(proc.name, None)
+            if stats is None or not stats.retries:
+                return
+            summary = self.retry_summaries[proc.name] = stats.summary()
+        elif not self.retry_summaries:
+            return
+        else:
+            summary = {
+                "jobs": sum(s["jobs"] for s in self.retry_summaries.values()),
+                "retries": sum(s["retries"] for s in self.retry_summaries.values()),
+                "procs": list(self.retry_summaries),
+                "wasted": sum(s["wasted"] for s in self.retry_summaries.values()),
+            }
+
+        if self.jsonl is not None:
+            self._log(self.jsonl.write, "retries", proc, summary)
+        elif proc is not None:
+            self._log(
+                proc.log,
+                "warning",
+                "Retried jobs: %s, retries: %s (%s), %.2f job-seconds spent "
+                "on failed attempts",
+                summary["jobs"],
+                summary["retries"],
+                ", ".join(
+                    f"{count}x: {njobs}"
+                    for count, njobs in summary["distribution"].items()
+                ),
+                summary["wasted"],
+                logger=logger,
+            )
+        else:
+            self._log(
+                logger.warning,
+                "Retried jobs: %s in %s, retries: %s, %.2f job-seconds spent "
+                "on failed attempts",
+                summary["jobs"],
+                ", ".join(summary["procs"]),
+                summary["retries"],
+                summary["wasted"],
+            )
+
+    @plugin.impl
+    @_tracked
+    async def on_job_cached(self, job: Job):
+        """Forget the reason of a cache miss for a cached job"""
+        if self.metrics is not None:
+            self.metrics.inc(job.proc.name, "cached")
+
+        explainer = self.cache_explainers.get(job.proc.name)
+        if explainer is not None:
+            explainer.reasons.pop(job.index, None)
+
+    def _report_cache_misses(self, proc: Proc) -> None:
+        """Log the reasons of the cache misses of the process, grouped"""
+        explainer = self.cache_explainers.pop(proc.name, None)
+        if explainer is None or not explainer.reasons:
+            return
+
+        summary = explainer.summary()
+        if self.jsonl is not None:
+            self._log(
+                self.jsonl.write,
+                "cache_misses",
+                proc,
+                {reason: indices for reason, indices in summary},
+            )
+            return
+
+        self._log(
+            proc.log,
+            "info",
+            "Cache misses: %s job(s)",
+            len(explainer.reasons),
+            logger=logger,
+        )
+        for reason, indices in summary:
+            self._log(
+                proc.log,
+                "info",
+                "  %s: %s (e.g. %s)",
+                reason,
+                len(indices),
+                brief_list(indices[:10]),
+                logger=logger,
+            )
+
+    def _report_prep(self, proc: Proc) -> None:
+        """Log the percentiles of the durations of the job preparation and
+        the script rendering of the process
+        """
+        prep_timer = self.prep_timers.pop(proc.name, None)
+        if prep_timer is None:
+            return
+
+        prep_timer.restore()
+        if not prep_timer.prep:  # pragma: no cover
+            # no output or script to render
+            return
+
+        summary = prep_timer.summary()
+        if self.jsonl is not None:
+            self._log(self.jsonl.write, "prep", proc, summary)
+            return
+
+        for name, stats in (
+            ("Job preparation", summary["prep"]),
+            ("Script rendering", summary["render"]),
+        ):
+            if stats is None:
+                continue
+            self._log(
+                proc.log,
+                "info",
+                "%s: p50 %ss, p90 %ss, p99 %ss, max %ss, total %ss",
+                name,
+                *(
+                    _format_secs(stats[key])
+                    for key in ("p50", "p90", "p99", "max", "total")
+                ),
+                logger=logger,
+            )
+        self._log(
+            proc.log,
+            "info",
+            "Slowest jobs to prepare: %s",
+            ", ".join(
+                f"{index} ({_format_secs(secs)}s)"
+                for index, secs in summary["slowest"].items()
+            ),
+            logger=logger,
+        )
+
+    def _report_suppressed(self, proc: Proc) -> None:
+        """Log the summary of the details of the process suppressed by
+        the rate limiter, in one line
+        """
+        summary = None if self.limiter is None else self.limiter.summary(proc.name)
+        if summary is None:
+            return
+
+        self._log(
+            proc.log,
+            "info",
+            "%s \u2014 suppressed%s",
+            summary,
+            ", see archive" if self.archive is not None else "",
+            logger=logger,
+        )
+
+    async def _scan_outputs(self, proc: Proc) -> None:
+        """Check the outputs of the finished jobs of the process, report the
+        problems grouped by the output keys, and write the index of the
+        outputs to `verbose.outputs.json` in the process workdir
+
+        The index also tells the input preflight of the later processes
+        the outputs that exist, so they are not checked again.
+        """
+        scan = self.output_scans.pop(proc.name, None)
+        if scan is None:
+            return
+
+        problems, index = await scan.scan(
+            [job for job in proc.jobs if job._status == JobStatus.FINISHED]
+        )
+        preflight = self._get_preflight(proc)
+        # the missing ones could still be created later
+        preflight.fine.update(
+            (path, stat[0]) for path, stat in index.items() if stat is not None
+        )
+
+        await (proc.workdir / "verbose.outputs.json").a_write_text(
+            _get_json_dumps()(
+                {
+                    path: None if stat is None else {"size": stat[1], "mtime": stat[2]}
+                    for path, stat in index.items()
+                }
+            )
+        )
+        if not problems:
+            return
+
+        if self.jsonl is not None:
+            self._log(
+                self.jsonl.write,
+                "output_scan",
+                proc,
+                [
+                    {"key": key, "problem": problem, "jobs": jobs}
+                    for (key, problem), jobs in problems.items()
+                ],
+                level="warning",
+            )
+            return
+
+        for (key, problem), jobs in problems.items():
+            self._log(
+                proc.log,
+                "warning",
+                "Output scan: out.%s %s in %s job(s) (%s)",
+                key,
+                problem,
+                len(jobs),
+                brief_list(jobs[:10]),
+                logger=logger,
+            )
+
+    @plugin.impl
+    @_tracked
+    async def on_proc_done(self, proc: Proc, succeeded: bool) -> None:
+        """Log the ellapsed time for the process.
+        If the process fails, log some error messages.
+        """
+        self.active_proc = None
+        if self.profiler is not None and proc.name in self.profiler.active:
+            await self._report_profile(proc)
+
+        self._report_cache_misses(proc)
+        self._report_retries(proc)
+        self._report_prep(proc)
+        await self._scan_outputs(proc)
+        self._report_suppressed(proc)
+        if self.memory is not None:
+            rss = self.memory.sample(proc.name)
+            start = self.memory.proc_start.pop(proc.name, rss)
+            self._report_memory(proc, rss, delta=rss - start)
+        elapsed = time() - self.tic
+        if self.jsonl is not None:
+            self._log(self.jsonl.write, "elapsed", proc, elapsed)
+        else:
+            self._log(
+                proc.log,
+                "info",
+                "Time elapsed: %ss",
+                _format_secs(elapsed),
+                logger=logger,
+            )
+
+        if succeeded:
+            return
+
+        # print error info if any job failed
+        failed_jobs = [
+            job.index for job in proc.jobs if job._status == JobStatus.FAILED
+        ]
+        if not failed_jobs:  # pragma: no cover
+            # could be triggered by Ctrl+C and all jobs are running
+            return
+
+        for j in proc.jobs:
+            if j.index == failed_jobs[0]:
+                job = j
+                break
+        else:  # pragma: no cover
+            # should not happen
+            return
+
+        stderr = (
+            await job.stderr_file.a_read_text()
+            if await job.stderr_file.a_is_file()
+            else ""
+        )
+        if self.jsonl is not None:
+            self._log(
+                self.jsonl.write,
+                "failure",
+                proc,
+                {
+                    "failed_jobs": failed_jobs,
+                    "stderr": stderr,
+                    "script_file": job.script_file.mounted,
+                    "stdout_file": job.stdout_file.mounted,
+                    "stderr_file": job.stderr_file.mounted,
+                },
+                job=job.index,
+                level="error",
+            )
+            return
+
+        self._log(
+            proc.log,
+            "error",
+            "[red]Failed jobs: %s[/red]",
+            brief_list(failed_jobs),
+            logger=logger,
+        )
+        kwargs = {"limit": job.index + 1, "logger": logger}
+        for line in stderr.splitlines():
+            self._log(job.log, "error", "[red]%s[/red]", escape(line), **kwargs)
+
+        self._log(
+            job.log,
+            "error",
+            "[red]-----------------------------------[/red]",
+            **kwargs,
+        )
         if not _is_mounted_path(job.script_file.mounted):
-            job.log("error", "script: %s", job.script_file, **kwargs)
-            job.log("error", "stdout: %s", job.stdout_file, **kwargs)
-            job.log("error", "stderr: %s", job.stderr_file, **kwargs)
+            self._log(job.log, "error", "script: %s", job.script_file, **kwargs)
+            self._log(job.log, "error", "stdout: %s", job.stdout_file, **kwargs)
+            self._log(job.log, "error", "stderr: %s", job.stderr_file, **kwargs)
         else:  # pragma: no cover
-            job.log("error", "script: %s", job.script_file.mounted, **kwargs)
-            job.log("error", "      \u2190 %s", job.script_file, **kwargs)
-            job.log("error", "stdout: %s", job.stdout_file.mounted, **kwargs)
-            job.log("error", "      \u2190 %s", job.stdout_file, **kwargs)
-            job.log("error", "stderr: %s", job.stderr_file.mounted, **kwargs)
-            job.log("error", "      \u2190 %s", job.stderr_file, **kwargs)
+            self._log(job.log, "error", "script: %s", job.script_file.mounted, **kwargs)
+            self._log(job.log, "error", "      \u2190 %s", job.script_file, **kwargs)
+            self._log(job.log, "error", "stdout: %s", job.stdout_file.mounted, **kwargs)
+            self._log(job.log, "error", "      \u2190 %s", job.stdout_file, **kwargs)
+            self._log(job.log, "error", "stderr: %s", job.stderr_file.mounted, **kwargs)
+            self._log(job.log, "error", "      \u2190 %s", job.stderr_file, **kwargs)
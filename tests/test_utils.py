@@ -1,7 +1,18 @@
 import pytest  # noqkey: F401
 
+import asyncio
+import gzip
+import json
+import time
+import logging
+import pandas
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
 from pathlib import Path
-from xqute.path import SpecPath
+from xqute.path import SpecLocalPath, SpecPath
 from pipen_verbose import (
     _format_secs,
     _format_atomic_value,
@@ -10,6 +21,27 @@ from pipen_verbose import (
     _format_value,
     _log_values,
     _pretty_format,
+    _summarize_input_data,
+    _sample_job_indices,
+    _fingerprint,
+    _json_default,
+    _AsyncSink,
+    _Profiler,
+    _format_bytes,
+    _get_rss,
+    _MemoryTracker,
+    _CacheMissExplainer,
+    _RetryStats,
+    _RateLimiter,
+    _OutputWatchdog,
+    _format_labels,
+    _Metrics,
+    _Archive,
+    _SyncTimer,
+    _InputPreflight,
+    _OutputScan,
+    _percentiles,
+    _PrepTimer,
 )
 
 
@@ -461,3 +493,793 @@ def test_pretty_real_case():
         "}"
     )
     assert result == expected
+
+
+def test_summarize_input_data():
+    import pandas
+
+    data = pandas.DataFrame(
+        {
+            "a": [1, 1, 1],
+            "b": [3, 1, 2],
+            "c": ["x", "y", "x"],
+            "d": [[1], [1], [1]],
+            "e": [[1], [2], [1]],
+        }
+    )
+    constant, varying = _summarize_input_data(data)
+    assert constant == {"a": 1, "d": [1]}
+    assert varying == {
+        "b": "3 distinct, 1 ~ 3, [0] 3, [2] 2",
+        "c": "2 distinct, [0] x, [2] x",
+        "e": "2 distinct, [0] [1], [2] [1]",
+    }
+
+
+@pytest.mark.parametrize(
+    "size,strategy,n,expected",
+    [
+        (0, "first", 3, set()),
+        (10, "first", 3, {0}),
+        (10, "last", 3, {9}),
+        (10, "ends", 3, {0, 9}),
+        (1, "ends", 3, {0}),
+        (10, "spread", 3, {0, 4, 9}),
+        (10, "spread", 1, {0}),
+        (2, "spread", 3, {0, 1}),
+    ],
+)
+def test_sample_job_indices(size, strategy, n, expected):
+    assert _sample_job_indices(size, strategy, n) == expected
+
+
+def test_sample_job_indices_random():
+    sampled = _sample_job_indices(100, "random", 5, seed=8)
+    assert len(sampled) == 5
+    assert all(0 <= i < 100 for i in sampled)
+    assert sampled == _sample_job_indices(100, "random", 5, seed=8)
+    assert _sample_job_indices(3, "random", 5) == {0, 1, 2}
+
+    with pytest.raises(ValueError, match="Unknown strategy"):
+        _sample_job_indices(10, "unknown")
+
+
+def test_fingerprint():
+    cache = {}
+    value = {"a": [1, 2], "b": {"c": {3}}}
+    fp = _fingerprint(value, cache)
+    assert fp == _fingerprint({"b": {"c": {3}}, "a": [1, 2]})
+    assert fp != _fingerprint({"a": [1, 2], "b": {"c": {4}}})
+    assert fp != _fingerprint({"a": (1, 2), "b": {"c": {3}}})
+    assert _fingerprint(1) != _fingerprint("1")
+    # the containers are cached
+    assert cache[id(value)] == (value, fp)
+    assert cache[id(value["a"])][0] is value["a"]
+    assert _fingerprint(value, cache) == fp
+
+
+def test_json_default():
+    import numpy
+
+    assert _json_default(Path("/a/b")) == "/a/b"
+    assert _json_default(SpecPath("/a/b", mounted="/c").mounted) == {
+        "path": "/c",
+        "spec": "/a/b",
+    }
+    assert _json_default({1}) == [1]
+    assert _json_default(numpy.int64(1)) == 1
+    assert isinstance(_json_default(numpy.int64(1)), int)
+    assert _json_default(numpy.float64(0.5)) == 0.5
+    assert _json_default(object).startswith("<class")
+
+
+def test_async_sink():
+    out = []
+    sink = _AsyncSink(interval=10)
+    sink.submit(out.append, 1)
+    sink.submit(out.append, 2)
+    sink.flush()
+    assert out == [1, 2]
+    sink.submit(out.append, 3)
+    sink.close()
+    assert out == [1, 2, 3]
+    # closed already
+    sink.flush()
+    sink.close()
+
+
+def test_async_sink_drop(caplog):
+    import threading
+    import time
+
+    out = []
+    blocker = threading.Event()
+    sink = _AsyncSink(interval=10, buffer_size=1, policy="drop")
+    # block the writer thread so the queue stays full
+    sink.submit(blocker.wait)
+    sink._wakeup.set()
+    while not sink.queue.empty():
+        time.sleep(0.01)
+    sink.submit(out.append, 1)
+    sink.submit(out.append, 2)
+    assert sink.dropped == 1
+    blocker.set()
+    sink.close()
+    assert out == [1]
+    assert "Dropped 1 verbose records" in caplog.text
+
+
+def test_async_sink_unknown_policy():
+    with pytest.raises(ValueError, match="Unknown backpressure policy"):
+        _AsyncSink(policy="unknown")
+
+
+def test_profiler():
+    import marshal
+    import tracemalloc
+
+    profiler = _Profiler(cprofile=True, tracemalloc=True, top=3)
+    profiler.start("p1")
+    profiler.start("p2")
+    data = [list(range(100)) for _ in range(1000)]
+    start1, stats, top_funcs, top_allocs = profiler.stop("p1")
+    assert isinstance(marshal.loads(stats), dict)
+    assert len(top_funcs) == 3
+    assert len(top_allocs) == 3
+    assert "test_utils.py" in "".join(top_allocs)
+    # still active for p2
+    assert profiler.profile is not None
+    assert tracemalloc.is_tracing()
+
+    start2, stats, top_funcs, top_allocs = profiler.stop("p2")
+    # the segment starts from the earliest active process
+    assert start2 == start1
+    assert profiler.profile is None
+    assert not tracemalloc.is_tracing()
+    del data
+
+
+def test_profiler_close():
+    import tracemalloc
+
+    profiler = _Profiler(cprofile=True, tracemalloc=True)
+    profiler.start("p1")
+    profiler.close()
+    assert profiler.profile is None
+    assert not tracemalloc.is_tracing()
+    assert not profiler.active
+
+
+@pytest.mark.parametrize(
+    "nbytes,expected",
+    [
+        (0, "0 B"),
+        (1023, "1023 B"),
+        (1024, "1.00 KiB"),
+        (1536 * 1024, "1.50 MiB"),
+        (-2 * 1024**3, "-2.00 GiB"),
+        (3 * 1024**4, "3.00 TiB"),
+    ],
+)
+def test_format_bytes(nbytes, expected):
+    assert _format_bytes(nbytes) == expected
+
+
+def test_memory_tracker():
+    assert _get_rss() > 0
+
+    tracker = _MemoryTracker(max_samples=2, with_gc=True)
+    tracker.sample(None)
+    tracker.sample("p1")
+    rss = tracker.sample("p2")
+    assert len(tracker.samples) == 2
+    assert tracker.samples[-1][1:3] == (rss, "p2")
+    assert len(tracker.samples[-1][3]) == 3
+    assert tracker.peak >= rss
+
+
+def _cache_miss_job(tmp_path, signature=None, rc="0", **kwargs):
+    """Make a job with a previous run to explain the cache miss of"""
+    metadir = SpecPath(tmp_path)
+    infile = SpecPath(tmp_path / "in.txt").mounted
+    outfile = SpecPath(tmp_path / "out.txt").mounted
+    (tmp_path / "in.txt").write_text("in")
+    (tmp_path / "out.txt").write_text("out")
+    (tmp_path / "job.script").write_text("script")
+    if rc is not None:
+        (tmp_path / "job.rc").write_text(rc)
+    if signature is not None:
+        (tmp_path / "job.signature.toml").write_text(signature)
+
+    job = SimpleNamespace(
+        index=0,
+        rc_file=metadir / "job.rc",
+        signature_file=metadir / "job.signature.toml",
+        script_file=metadir / "job.script",
+        proc=SimpleNamespace(
+            input=SimpleNamespace(
+                type=kwargs.get("intypes", {"a": "var", "b": "file", "c": "files"})
+            )
+        ),
+        input=kwargs.get("input", {"a": 1, "b": infile, "c": [infile]}),
+        _output_types={"x": "var", "y": "file"},
+        output=kwargs.get("output", {"x": 1, "y": outfile}),
+    )
+
+    async def get_rc():
+        return int(await job.rc_file.a_read_text())
+
+    job.get_rc = get_rc
+    return job
+
+
+_SIGNATURE = """
+ctime = {ctime}
+[input.type]
+a = "var"
+b = "file"
+c = "files"
+[input.data]
+a = 1
+b = "{tmp}/in.txt"
+c = ["{tmp}/in.txt"]
+[output.type]
+x = "var"
+y = "file"
+[output.data]
+x = 1
+y = "{tmp}/out.txt"
+"""
+
+
+@pytest.mark.parametrize(
+    "kind,expected",
+    [
+        ("nothing", None),
+        ("no_rc", "no previous run"),
+        ("failed", "previous run failed"),
+        ("no_signature", "missing signature"),
+        ("invalid_signature", "invalid signature"),
+        ("types", "changed input/output types"),
+        ("script", "changed script"),
+        ("envs", "changed envs"),
+        ("var", "changed input (a)"),
+        ("none", "changed input (b)"),
+        ("both_none", None),
+        ("path", "changed input (c)"),
+        ("mtime", "newer input file (b)"),
+        ("output_var", "changed output (x)"),
+        ("output_path", "changed output (y)"),
+        ("output_missing", "missing output (y)"),
+    ],
+)
+def test_cache_miss_explainer(tmp_path, kind, expected):
+    ctime = 1e12
+    if kind in ("script", "envs", "mtime"):
+        ctime = 1.0
+    signature = _SIGNATURE.format(ctime=ctime, tmp=tmp_path)
+    kwargs = {}
+    if kind == "no_signature":
+        signature = None
+    elif kind == "invalid_signature":
+        signature = "a = "
+    elif kind == "types":
+        signature = signature.replace('x = "var"', 'x = "file"')
+    elif kind == "var":
+        kwargs["input"] = {"a": 2}
+    elif kind == "none":
+        kwargs["input"] = {"a": 1, "b": None}
+    elif kind == "both_none":
+        signature = signature.replace(f'b = "{tmp_path}/in.txt"\n', "")
+        kwargs["input"] = {"a": 1, "b": None, "c": []}
+        signature = signature.replace(f'c = ["{tmp_path}/in.txt"]', "c = []")
+    elif kind == "path":
+        kwargs["input"] = {"a": 1, "b": SpecPath(tmp_path / "in.txt").mounted, "c": []}
+    elif kind == "output_var":
+        kwargs["output"] = {"x": 2}
+    elif kind == "output_path":
+        kwargs["output"] = {"x": 1, "y": SpecPath(tmp_path / "other.txt").mounted}
+    elif kind == "mtime":
+        signature = signature.replace('a = "var"\n', "").replace("a = 1\n", "")
+        kwargs["intypes"] = {"b": "file", "c": "files"}
+
+    job = _cache_miss_job(
+        tmp_path,
+        signature,
+        rc={"no_rc": None, "failed": "1"}.get(kind, "0"),
+        **kwargs,
+    )
+    if kind == "output_missing":
+        (tmp_path / "out.txt").unlink()
+    elif kind == "mtime":
+        os.utime(tmp_path / "job.script", (0, 0))
+
+    explainer = _CacheMissExplainer(dirsig=0, envs_changed=kind == "envs")
+    if expected is None:
+        assert asyncio.run(explainer._explain(job)) is None
+        return
+
+    asyncio.run(explainer.explain(job))
+    assert explainer.reasons == {0: expected}
+    assert explainer.summary() == [(expected, [0])]
+
+
+def test_cache_miss_explainer_summary():
+    explainer = _CacheMissExplainer()
+    explainer.reasons = {0: "a", 1: "b", 2: "b", 3: "unknown"}
+    assert explainer.summary() == [("b", [1, 2]), ("a", [0]), ("unknown", [3])]
+
+
+def test_retry_stats():
+    stats = _RetryStats()
+    assert not stats.start(0)
+    stats.fail(0)
+    assert stats.start(0)
+    stats.fail(0)
+    assert stats.start(0)
+    stats.finish(0)
+    stats.start(1)
+    stats.fail(1)
+    stats.start(1)
+    stats.finish(1)
+    # not retried
+    stats.start(2)
+    stats.fail(2)
+    # failed before started
+    stats.fail(3)
+    assert stats.start(3)
+    stats.finish(3)
+    summary = stats.summary()
+    assert summary["jobs"] == 3
+    assert summary["retries"] == 4
+    assert summary["distribution"] == {1: 2, 2: 1}
+    assert summary["wasted"] >= 0
+    assert stats.started == {}
+
+
+def test_rate_limiter():
+    limiter = _RateLimiter({"INFO": 1000, "debug": 0.001, "warning": 0.001}, burst=3)
+    assert set(limiter.buckets) == {"info", "debug"}
+    assert limiter.allow("warning", 100)
+    assert limiter.allow("debug", 2)
+    assert not limiter.allow("debug", 2)
+    # larger than the burst, allowed when the bucket is full
+    assert limiter.allow("info", 10)
+    assert not limiter.allow("info", 1)
+    time.sleep(0.02)
+    assert limiter.allow("info", 1)
+
+    assert limiter.summary("proc") is None
+    limiter.suppress("proc", "envs", 42)
+    limiter.suppress("proc", "in", 3)
+    limiter.suppress("proc", "in", 3)
+    limiter.suppress("proc", "indata", 100, unit="rows")
+    assert limiter.summary("proc") == (
+        "envs: 42 keys, in: 6 keys of 2 job(s), indata: 100 rows"
+    )
+    assert limiter.summary("proc") is None
+
+
+def test_output_watchdog(tmp_path):
+    jobs = []
+    for i in range(3):
+        (tmp_path / str(i) / "output").mkdir(parents=True)
+        jobs.append(
+            SimpleNamespace(
+                index=i,
+                proc=SimpleNamespace(name="proc"),
+                stdout_file=SpecPath(tmp_path / str(i) / "job.stdout"),
+                stderr_file=SpecPath(tmp_path / str(i) / "job.stderr"),
+                outdir=SpecPath(tmp_path / str(i) / "output"),
+            )
+        )
+
+    watchdog = _OutputWatchdog(max_size=10, max_rate=1e9, max_stats=4)
+    for job in jobs:
+        watchdog.add(job)
+    # no files yet, checking 2 jobs per sweep
+    assert asyncio.run(watchdog.sweep()) == []
+    assert list(watchdog.order) == [("proc", 2), ("proc", 0), ("proc", 1)]
+
+    (tmp_path / "2" / "job.stdout").write_text("x" * 20)
+    (tmp_path / "0" / "job.stderr").write_text("x" * 5)
+    assert [
+        (job.index, name, kind, size)
+        for job, name, kind, size, _ in asyncio.run(watchdog.sweep())
+    ] == [(2, "stdout", "size", 20)]
+    # warned only once
+    assert asyncio.run(watchdog.sweep()) == []
+
+    watchdog.remove(jobs[2])
+    watchdog.max_rate = 0
+    watchdog.max_stats = 100
+    (tmp_path / "0" / "job.stderr").write_text("x" * 8)
+    warnings = asyncio.run(watchdog.sweep())
+    assert [(job.index, name, kind) for job, name, kind, _, _ in warnings] == [
+        (0, "stderr", "rate")
+    ]
+    assert warnings[0][4] > 0
+    assert ("proc", 2, "stdout") not in watchdog.sizes
+
+    watchdog = _OutputWatchdog(max_size=10, with_outdir=True)
+    watchdog.add(jobs[1])
+    (tmp_path / "1" / "output" / "sub").mkdir()
+    (tmp_path / "1" / "output" / "a.txt").write_text("x" * 6)
+    (tmp_path / "1" / "output" / "sub" / "b.txt").write_text("x" * 6)
+    assert [
+        (job.index, name, kind, size)
+        for job, name, kind, size, _ in asyncio.run(watchdog.sweep())
+    ] == [(1, "outdir", "size", 12)]
+
+
+def test_output_watchdog_max_stats(tmp_path, monkeypatch):
+    jobs = []
+    for i in range(3):
+        (tmp_path / str(i) / "output").mkdir(parents=True)
+        for j in range(50):
+            (tmp_path / str(i) / "output" / f"{j}.txt").write_text("x")
+        jobs.append(
+            SimpleNamespace(
+                index=i,
+                proc=SimpleNamespace(name="proc"),
+                stdout_file=SpecPath(tmp_path / str(i) / "job.stdout"),
+                stderr_file=SpecPath(tmp_path / str(i) / "job.stderr"),
+                outdir=SpecPath(tmp_path / str(i) / "output"),
+            )
+        )
+
+    calls = []
+    for method in ("a_stat", "a_is_dir", "a_iterdir"):
+        orig = getattr(SpecLocalPath, method)
+
+        def counted(self, *args, _orig=orig, **kwargs):
+            calls.append(self)
+            return _orig(self, *args, **kwargs)
+
+        monkeypatch.setattr(SpecLocalPath, method, counted)
+
+    watchdog = _OutputWatchdog(max_size=10, max_stats=5, with_outdir=True)
+    for job in jobs:
+        watchdog.add(job)
+    assert asyncio.run(watchdog.sweep()) == []
+    assert len(calls) == 5
+    # one job per sweep, the output directory is too large to walk
+    assert set(watchdog.sizes) == {("proc", 0, "stdout"), ("proc", 0, "stderr")}
+
+    calls.clear()
+    watchdog.max_stats = 220
+    assert [
+        (job.index, name, kind, size)
+        for job, name, kind, size, _ in asyncio.run(watchdog.sweep())
+    ] == [(1, "outdir", "size", 50), (2, "outdir", "size", 50)]
+    assert len(calls) <= 220
+    # the budget ran out for the output directory of job 0
+    assert ("proc", 0, "outdir") not in watchdog.sizes
+
+
+def test_format_labels():
+    assert _format_labels(a=1, b='x"y\\z\nw') == 'a="1",b="x\\"y\\\\z\\nw"'
+
+
+def test_metrics(tmp_path):
+    path = tmp_path / "sub" / "verbose.prom"
+    metrics = _Metrics(path, "pipeline", buckets=(5, 1))
+    metrics.inc("proc", "init")
+    metrics.inc("proc", "init")
+    metrics.observe("proc", 0.5)
+    metrics.observe("proc", 1)
+    metrics.observe("proc", 10)
+    metrics.write()
+    content = path.read_text()
+    assert 'pipen_jobs_total{pipeline="pipeline",proc="proc",state="init"} 2' in (
+        content
+    )
+    assert (
+        'pipen_job_duration_seconds_bucket{pipeline="pipeline",proc="proc",le="1"} 2'
+    ) in content
+    assert (
+        'pipen_job_duration_seconds_bucket{pipeline="pipeline",proc="proc",le="5"} 2'
+    ) in content
+    assert (
+        'pipen_job_duration_seconds_bucket{pipeline="pipeline",proc="proc",le="+Inf"} 3'
+    ) in content
+    assert 'pipen_job_duration_seconds_sum{pipeline="pipeline",proc="proc"} 11.5' in (
+        content
+    )
+    assert 'pipen_pipeline_running{pipeline="pipeline"} 1' in content
+    # the elapsed time is updated with nothing else changed
+    time.sleep(0.02)
+    metrics.write()
+    assert path.read_text() != content
+    assert [p.name for p in path.parent.iterdir()] == ["verbose.prom"]
+
+
+def test_sync_timer():
+    async def hook(fail=False):
+        time.sleep(0.05)
+        await asyncio.sleep(0.2)
+        if fail:
+            raise ValueError("failed")
+        return 1
+
+    async def main():
+        timer = _SyncTimer(hook())
+        assert await timer == 1
+        # the time waiting for the sleep is left out
+        assert 0.05 <= timer.elapsed < 0.2
+
+        timer = _SyncTimer(hook(fail=True))
+        with pytest.raises(ValueError, match="failed"):
+            await timer
+        assert 0.05 <= timer.elapsed < 0.2
+
+        task = asyncio.ensure_future(_SyncTimer(hook()))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # closed before finished
+        timer = _SyncTimer(hook())
+        awaiting = timer.__await__()
+        next(awaiting)
+        awaiting.close()
+        assert timer.coro.cr_frame is None
+
+    asyncio.run(main())
+
+
+def test_archive(tmp_path):
+    archive = _Archive(tmp_path / "sub" / "archive", "pipeline", max_bytes=1, run="r")
+    archive.write("envs", SimpleNamespace(name="proc"), {"x": "y" * 1000})
+    archive.write("job", SimpleNamespace(name="proc"), {"a": Path("/a")}, job=1)
+    archive.flush()
+    log = logging.getLogger("pipen_verbose_test_archive")
+    log.addHandler(archive)
+    log.warning("hello %s", "world")
+    log.removeHandler(archive)
+    archive.close()
+    # closed twice
+    archive.close()
+
+    files = sorted((tmp_path / "sub").iterdir())
+    assert [f.name for f in files] == [
+        "archive.r.1.jsonl.gz",
+        "archive.r.2.jsonl.gz",
+        "archive.r.3.jsonl.gz",
+    ]
+    items = [json.loads(gzip.decompress(f.read_bytes())) for f in files]
+    assert items[0]["kind"] == "envs"
+    assert items[0]["proc"] == "proc"
+    assert items[0]["data"] == {"x": "y" * 1000}
+    assert items[1]["job"] == 1
+    assert items[1]["data"] == {"a": "/a"}
+    assert items[2]["kind"] == "log"
+    assert items[2]["level"] == "warning"
+    assert items[2]["data"] == "hello world"
+
+
+def test_archive_backups(tmp_path):
+    archive = _Archive(
+        tmp_path / "archive", "pipeline", max_bytes=1, backups=2, run="r1"
+    )
+    for i in range(5):
+        archive.write("log", None, i)
+    archive.close()
+    assert sorted(f.name for f in tmp_path.iterdir()) == [
+        "archive.r1.4.jsonl.gz",
+        "archive.r1.5.jsonl.gz",
+    ]
+
+    # keep only the current file, of each run
+    for run, backups in (("r2", 0), ("r3", -1)):
+        archive = _Archive(
+            tmp_path / "archive", "pipeline", max_bytes=1, backups=backups, run=run
+        )
+        for i in range(3):
+            archive.write("log", None, i)
+        archive.close()
+        path = tmp_path / f"archive.{run}.3.jsonl.gz"
+        assert json.loads(gzip.decompress(path.read_bytes()))["data"] == 2
+
+    assert sorted(f.name for f in tmp_path.iterdir()) == [
+        "archive.r1.4.jsonl.gz",
+        "archive.r1.5.jsonl.gz",
+        "archive.r2.3.jsonl.gz",
+        "archive.r3.3.jsonl.gz",
+    ]
+
+    with pytest.raises(ValueError, match="Unknown compression"):
+        _Archive(tmp_path / "archive", "pipeline", compression="bz2")
+
+
+def test_archive_runs(tmp_path):
+    # the runs are named by the start time by default
+    archives = [
+        _Archive(tmp_path / "archive", "pipeline", max_bytes=1, backups=1)
+        for _ in range(2)
+    ]
+    assert archives[0].run != archives[1].run
+    for archive in archives:
+        archive.write("log", None, archive.run)
+        archive.write("log", None, archive.run)
+        archive.close()
+
+    # the files of the other run are kept
+    files = sorted(tmp_path.iterdir())
+    assert [f.name for f in files] == [
+        f"archive.{archive.run}.2.jsonl.gz" for archive in archives
+    ]
+    for archive, path in zip(archives, files):
+        item = json.loads(gzip.decompress(path.read_bytes()))
+        assert item["data"] == archive.run
+
+
+def test_input_preflight(tmp_path, monkeypatch):
+    (tmp_path / "a.txt").write_text("a")
+    (tmp_path / "unreadable.txt").write_text("a")
+    (tmp_path / "dir").mkdir()
+    a, dir_ = str(tmp_path / "a.txt"), str(tmp_path / "dir")
+    missing = str(tmp_path / "missing.txt")
+    proc = SimpleNamespace(
+        input=SimpleNamespace(
+            type={"a": "file", "b": "dirs", "c": "var"},
+            data=pandas.DataFrame(
+                {
+                    "a": [a, missing, f"{missing}:/mnt/x", None, missing],
+                    "b": [[dir_], [dir_, a], a, [dir_], [dir_]],
+                    "c": [1, 2, 3, 4, 5],
+                }
+            ),
+        ),
+    )
+    real_access = os.access
+    monkeypatch.setattr(
+        "os.access",
+        lambda path, mode: "unreadable" not in str(path) and real_access(path, mode),
+    )
+
+    preflight = _InputPreflight(concurrency=2)
+    assert asyncio.run(preflight.check(proc)) == {
+        ("a", "missing"): ([1, 2, 4], missing),
+        ("b", "not a directory"): ([1, 2], a),
+    }
+    # only the ones checked fine are cached
+    assert preflight.fine == {(a, False), (dir_, True)}
+
+    checked = []
+    check_path = _InputPreflight._check_path
+
+    async def checking_path(self, spec, isdir):
+        checked.append(str(spec))
+        return await check_path(self, spec, isdir)
+
+    monkeypatch.setattr(_InputPreflight, "_check_path", checking_path)
+    proc.input.type = {"a": "file"}
+    proc.input.data = pandas.DataFrame({"a": [a, str(tmp_path / "unreadable.txt")]})
+    assert asyncio.run(preflight.check(proc)) == {
+        ("a", "not readable"): ([1], str(tmp_path / "unreadable.txt")),
+    }
+    # a.txt is cached
+    assert checked == [str(tmp_path / "unreadable.txt")]
+
+    # the missing one is checked again, after it is created
+    checked.clear()
+    proc.input.data = pandas.DataFrame({"a": [a, missing]})
+    assert asyncio.run(preflight.check(proc)) == {("a", "missing"): ([1], missing)}
+    Path(missing).write_text("a")
+    assert asyncio.run(preflight.check(proc)) == {}
+    assert checked == [missing, missing]
+
+
+def test_output_scan(tmp_path):
+    (tmp_path / "ok.txt").write_text("x")
+    (tmp_path / "empty.txt").write_text("")
+    (tmp_path / "stale.txt").write_text("x")
+    os.utime(tmp_path / "stale.txt", (0, 0))
+    (tmp_path / "emptydir").mkdir()
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "x").write_text("x")
+
+    def job(index, b, c):
+        return SimpleNamespace(
+            index=index,
+            _output_types={"a": "var", "b": "file", "c": "dir"},
+            output={
+                "a": 1,
+                "b": SpecPath(tmp_path / b).mounted,
+                "c": SpecPath(tmp_path / c).mounted,
+            },
+        )
+
+    scan = _OutputScan(concurrency=2)
+    scan.started = {0: time.time(), 1: time.time(), 2: time.time()}
+    problems, index = asyncio.run(
+        scan.scan(
+            [
+                job(0, "ok.txt", "dir"),
+                job(1, "empty.txt", "emptydir"),
+                job(2, "stale.txt", "missing"),
+                # cached job
+                job(3, "stale.txt", "dir"),
+            ]
+        )
+    )
+    assert problems == {
+        ("b", "empty"): [1],
+        ("c", "empty"): [1],
+        ("b", "older than the job start"): [2],
+        ("c", "missing"): [2],
+    }
+    assert index[str(tmp_path / "ok.txt")][:2] == (False, 1)
+    assert index[str(tmp_path / "dir")][:2] == (True, 1)
+    assert index[str(tmp_path / "missing")] is None
+
+
+def test_percentiles():
+    assert _percentiles(list(range(10, 0, -1))) == {
+        "p50": 5,
+        "p90": 9,
+        "p99": 10,
+        "max": 10,
+        "total": 55,
+    }
+    assert _percentiles([3], (10,)) == {"p10": 3, "max": 3, "total": 3}
+
+
+def test_prep_timer():
+    from pipen.template import TemplateLiquid
+
+    proc = SimpleNamespace(
+        output=TemplateLiquid("out:{{job.index}}"),
+        script=TemplateLiquid("echo {{job.index}}"),
+    )
+    timer = _PrepTimer(proc)
+    for index in (0, 1):
+        assert proc.output.render({"job": {"index": index}}) == f"out:{index}"
+        assert proc.script.render({"job": {"index": index}}) == f"echo {index}"
+        assert timer.done(index) >= timer.render[index] > 0
+    assert timer.done(2) is None
+
+    summary = timer.summary(top=1)
+    assert summary["jobs"] == 2
+    assert summary["prep"]["max"] == max(timer.prep.values())
+    assert summary["render"]["total"] == sum(timer.render.values())
+    assert list(summary["slowest"]) == [max(timer.prep, key=timer.prep.get)]
+
+    timer.restore()
+    assert "render" not in vars(proc.script)
+
+    # no output or script
+    timer = _PrepTimer(SimpleNamespace(output=None, script=None))
+    assert timer._templates == []
+
+    # a list of output templates, without script
+    proc = SimpleNamespace(
+        output=[TemplateLiquid("a:{{job.index}}"), TemplateLiquid("b:1")],
+        script=None,
+    )
+    timer = _PrepTimer(proc)
+    assert len(timer._templates) == 2
+    assert [out.render({"job": {"index": 0}}) for out in proc.output] == [
+        "a:0",
+        "b:1",
+    ]
+    assert timer.done(0) > 0
+    assert timer.render == {}
+    timer.restore()
+    assert all("render" not in vars(out) for out in proc.output)
+
+
+def test_lazy_imports():
+    # the optional and heavy dependencies are imported when needed
+    heavy = ["pandas", "orjson", "psutil", "zstandard", "cProfile", "tracemalloc"]
+    code = f"import sys, pipen_verbose; print([m for m in {heavy} if m in sys.modules])"
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=Path(__file__).parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert out.strip() == "[]"
@@ -1,9 +1,22 @@
+import asyncio
+import gzip
+import json
+import time
 from pathlib import Path
 from shutil import rmtree
 from tempfile import gettempdir
+from types import SimpleNamespace
 import pytest
 from pipen import Pipen, Proc
-from pipen_verbose import PipenVerbose
+from pipen.exceptions import ProcInputValueError
+from xqute import JobStatus
+from xqute.path import SpecPath
+from pipen_verbose import (
+    PipenVerbose,
+    _InputPreflight,
+    _OutputScan,
+    logger as verbose_logger,
+)
 
 TEST_TMPDIR = Path(gettempdir()) / "pipen_verbose_tests"
 rmtree(TEST_TMPDIR, ignore_errors=True)
@@ -20,9 +33,29 @@ def pipen():
         cache=False,
         plugins=[PipenVerbose],
         outdir=TEST_TMPDIR / f"pipen_{index}",
+        workdir=TEST_TMPDIR / ".pipen",
     )
 
 
+@pytest.fixture
+def make_pipen():
+    """Make a pipeline with the given plugin options"""
+
+    def _make_pipen(loglevel="info", **plugin_opts):
+        index = Pipen.PIPELINE_COUNT + 1
+        return Pipen(
+            name=f"pipeline_{index}",
+            loglevel=loglevel,
+            cache=False,
+            plugins=[PipenVerbose],
+            outdir=TEST_TMPDIR / f"pipen_{index}",
+            workdir=TEST_TMPDIR / f"workdir_{index}",
+            plugin_opts=plugin_opts,
+        )
+
+    return _make_pipen
+
+
 class NormalProc(Proc):
     input = "a"
     output = "b:{{in.a}}"
@@ -44,9 +77,68 @@ class MultiJobProc(Proc):
     input_data = [0, 1]
 
 
+class FileProc(Proc):
+    input = "a:file"
+    output = "b:file:b.txt"
+    script = "echo {{envs.x}} > {{out.b}}"
+
+
+class FlakyProc(Proc):
+    """Fail until the job has run {{in.n}} times"""
+    input = "counter, n:var"
+    output = "b:var:1"
+    script = "echo >> {{in.counter}}; [ $(wc -l < {{in.counter}}) -ge {{in.n}} ]"
+    error_strategy = "retry"
+    num_retries = 3
+
+
+class FlakyMissingOutputProc(Proc):
+    """Fail the first attempt, then exit 0 with the output generated only if
+    {{in.touch}} is true"""
+    input = "marker, touch:var"
+    output = "b:file:b.txt"
+    script = (
+        "sleep 0.2; "
+        "if [ ! -e {{in.marker}} ]; then touch {{in.marker}}; exit 1; fi; "
+        "{% if in.touch %}touch {{out.b}}{% endif %}"
+    )
+    error_strategy = "retry"
+    # no retry after the attempt with the output missing, which is up to xqute
+    num_retries = 1
+
+
+class VerboseProc(Proc):
+    input = "a"
+    script = "for i in $(seq 1 10); do seq 1 100; sleep 0.1; done; exit {{in.a}}"
+
+
+class OutputProc(Proc):
+    """Write an empty output for in.a == 0, and a non-empty one otherwise"""
+    input = "a"
+    output = "b:file:b.txt, c:dir:c"
+    script = (
+        "{% if in.a == 0 %}touch {{out.b}}{% else %}echo x > {{out.b}}{% endif %}; "
+        "touch {{out.c}}/x"
+    )
+
+
 def test_normal(pipen, caplog):
     pipen.set_starts(NormalProc).run()
     assert "Time elapsed" in caplog.text
+    # the overhead is only reported at the debug level by default
+    assert "Overhead" not in caplog.text
+
+
+def test_indata(pipen, caplog):
+    # the input data is only rendered when the debug level is enabled
+    verbose_logger.setLevel("DEBUG")
+    try:
+        proc = Proc.from_proc(NormalProc, input_data=[1, 2])
+        pipen.set_starts(proc).run()
+    finally:
+        verbose_logger.setLevel("INFO")
+    assert "indata:" in caplog.text
+    assert "[2 rows x 1 columns]" in caplog.text
 
 
 def test_cached_procs_showing_input_output(pipen, caplog):
@@ -93,3 +185,650 @@ def test_path_shorten(pipen, caplog):
         ],
     )
     pipen.set_starts(proc).run()
+
+
+def test_input_summary(pipen, caplog):
+    class InputSummaryProc(Proc):
+        input = "a, b"
+        output = "c:{{in.a}}"
+        input_data = [(1, "x"), (2, "x"), (3, "x")]
+        plugin_opts = {"verbose_input_summary": True}
+
+    pipen.set_starts(InputSummaryProc).run()
+    assert "in(summary).a: 3 distinct, 1 ~ 3, \\[0] 1, \\[2] 3" in caplog.text
+    assert "in(summary).b: x" in caplog.text
+
+
+def test_shown_jobs_last(pipen, caplog):
+    proc = Proc.from_proc(
+        NormalProc,
+        input_data=list(range(6)),
+        plugin_opts={"verbose_jobs": "last"},
+    )
+    pipen.set_starts(proc).run()
+    assert "[5/5] in.a: 5" in caplog.text
+    assert "[0/5] in.a: 0" not in caplog.text
+
+
+def test_envs_dedup(pipen, caplog):
+    class EnvsDedupProc1(Proc):
+        input = "a"
+        input_data = [1]
+        envs = {"x": 1, "y": {"z": [1, 2]}}
+        plugin_opts = {"verbose_envs_dedup": True}
+
+    class EnvsDedupProc2(EnvsDedupProc1):
+        requires = EnvsDedupProc1
+        envs = {"x": 2}
+
+    class EnvsDedupProc3(Proc):
+        requires = EnvsDedupProc2
+        input = "a"
+        envs = {"x": 2, "y": {"z": [1, 2], "w": 3}}
+        plugin_opts = {"verbose_envs_dedup": True}
+
+    pipen.set_starts(EnvsDedupProc1).run()
+    assert "EnvsDedupProc1:[/cyan] envs (#E1):" in caplog.text
+    assert "EnvsDedupProc1:[/cyan] envs.y: {'z': \\[1, 2]}" in caplog.text
+    assert "EnvsDedupProc2:[/cyan] envs (#E2):" in caplog.text
+    assert "EnvsDedupProc2:[/cyan] envs.x: 2" in caplog.text
+    assert "EnvsDedupProc2:[/cyan] envs: y same as #E1 (EnvsDedupProc1)" in (
+        caplog.text
+    )
+    # nested subtrees
+    assert "EnvsDedupProc3:[/cyan] envs (#E3):" in caplog.text
+    assert "EnvsDedupProc3:[/cyan] envs.y.w: 3" in caplog.text
+    assert "EnvsDedupProc3:[/cyan] envs: x same as #E2 (EnvsDedupProc2)" in (
+        caplog.text
+    )
+    assert "EnvsDedupProc3:[/cyan] envs: y.z same as #E1 (EnvsDedupProc1)" in (
+        caplog.text
+    )
+    assert "envs.y.z" not in caplog.text
+
+
+def test_jsonl(make_pipen, caplog, tmp_path):
+    jsonl = tmp_path / "verbose.jsonl"
+    pipen = make_pipen(loglevel="debug", verbose_jsonl=str(jsonl))
+    proc = Proc.from_proc(MultiJobProc, input_data=[0, 1])
+    pipen.set_starts(proc).run()
+    assert "Time elapsed" not in caplog.text
+    items = [json.loads(line) for line in jsonl.read_text().splitlines()]
+    kinds = [item["kind"] for item in items]
+    assert kinds == [
+        "props",
+        "envs",
+        "input",
+        "output",
+        "elapsed",
+        "failure",
+        "overhead",
+    ]
+    assert items[2]["proc"] == "proc"
+    assert items[2]["job"] == 0
+    assert items[2]["data"] == {"a": 0}
+    assert items[5]["level"] == "error"
+    assert items[5]["data"]["failed_jobs"] == [1]
+    assert "123" in items[5]["data"]["stderr"]
+    assert items[6]["proc"] is None
+    assert items[6]["data"]["hooks"]["on_job_init"]["calls"] == 2
+    assert items[6]["data"]["bytes"] > 0
+
+
+def test_jsonl_default_path(make_pipen):
+    pipen = make_pipen(
+        verbose_jsonl=True,
+        verbose_input_summary=True,
+        verbose_memory=True,
+        verbose_cache_miss=True,
+    )
+    proc = Proc.from_proc(MultiJobProc, input_data=[0, 1], cache=True)
+    pipen.set_starts(proc).run()
+    jsonl = Path(pipen.workdir) / "verbose.jsonl"
+    items = [json.loads(line) for line in jsonl.read_text().splitlines()]
+    assert items[0]["kind"] == "input_summary"
+    assert items[0]["data"] == {
+        "constant": {},
+        "varying": {"a": "2 distinct, 0 ~ 1, [0] 0, [1] 1"},
+    }
+    memory = [item for item in items if item["kind"] == "memory"]
+    assert memory[0]["proc"] == "proc"
+    assert memory[0]["data"]["rss"] > 0
+    assert memory[1]["proc"] is None
+    assert memory[1]["data"]["peak_proc"] in ("proc", None)
+    cache_misses = [item for item in items if item["kind"] == "cache_misses"]
+    assert cache_misses[0]["data"] == {"no previous run": [0, 1]}
+
+
+def test_async_sink(make_pipen, caplog):
+    pipen = make_pipen(
+        loglevel="debug",
+        verbose_async=True,
+        verbose_async_interval=0.1,
+    )
+    proc = Proc.from_proc(MultiJobProc, input_data=[0, 1])
+    pipen.set_starts(proc).run()
+    assert "proc:[/cyan] [0/1] in.a: 0" in caplog.text
+    assert "Failed jobs" in caplog.text
+    assert "Time elapsed" in caplog.text
+
+
+def test_async_sink_jsonl(make_pipen, tmp_path):
+    pipen = make_pipen(
+        verbose_jsonl=str(tmp_path / "verbose.jsonl"),
+        verbose_async=True,
+        # only written when the pipeline completes
+        verbose_async_interval=60,
+    )
+    # the job runs for about 1 second
+    proc = Proc.from_proc(VerboseProc, input_data=[0])
+    pipen.set_starts(proc).run()
+    items = {
+        item["kind"]: item
+        for item in map(
+            json.loads, (tmp_path / "verbose.jsonl").read_text().splitlines()
+        )
+    }
+    # the items keep the time of the events
+    assert items["elapsed"]["time"] - items["envs"]["time"] > 0.9
+
+
+@pytest.mark.parametrize(
+    "running,last_hook,expected",
+    [
+        (
+            {1: ("on_job_init", "P1", 0)},
+            None,
+            "while running on_job_init for P1\n",
+        ),
+        (
+            {1: ("on_job_init", "P1", 1), 2: ("on_proc_done", "P0", 0)},
+            ("on_job_init", "P1", 0, 0.5),
+            "while running on_proc_done for P0 (and 1 other hook(s))",
+        ),
+        (
+            {},
+            ("on_proc_start", "P2", 1e9, 1e9 + 0.5),
+            "in on_proc_start for P2 (took 00:00:00.500s)",
+        ),
+        ({}, None, "outside pipen-verbose hooks (active process: P3)"),
+    ],
+)
+def test_monitor_lag(caplog, running, last_hook, expected):
+    async def main():
+        plugin = PipenVerbose()
+        plugin.running = running
+        plugin.last_hook = last_hook
+        plugin.active_proc = "P3"
+        task = asyncio.get_running_loop().create_task(plugin._monitor_lag(0.1, 0.01))
+        await asyncio.sleep(0.02)
+        time.sleep(0.2)  # block the event loop
+        await asyncio.sleep(0.02)
+        task.cancel()
+
+    asyncio.run(main())
+    assert "Event loop blocked for 00:00:00." in caplog.text
+    assert expected in caplog.text
+
+
+def test_tracked_concurrent_hooks():
+    from pipen_verbose import _tracked
+
+    @_tracked
+    async def hook(self, proc, delay):
+        await asyncio.sleep(delay)
+        return sorted(running[0] for running in self.running.values())
+
+    async def main():
+        plugin = PipenVerbose()
+        proc = SimpleNamespace(name="proc")
+        return plugin, await asyncio.gather(
+            hook(plugin, proc, 0.01), hook(plugin, proc, 0.05)
+        )
+
+    plugin, running = asyncio.run(main())
+    # the first hook to finish does not clear the running one
+    assert running == [["hook", "hook"], ["hook"]]
+    assert plugin.running == {}
+    assert plugin.overhead["hook"][0] == 2
+
+
+def test_lag_monitor_enabled(make_pipen, caplog):
+    pipen = make_pipen(verbose_lag_threshold=60)
+    proc = Proc.from_proc(NormalProc, input_data=[1])
+    pipen.set_starts(proc).run()
+    assert "Time elapsed" in caplog.text
+    assert "Event loop blocked" not in caplog.text
+
+
+def test_overhead_report(make_pipen, caplog):
+    pipen = make_pipen(
+        loglevel="debug",
+        verbose_overhead_budget=50,
+        verbose_overhead_report=True,
+    )
+    proc = Proc.from_proc(NormalProc, input_data=[1])
+    pipen.set_starts(proc).run()
+    assert "Overhead of on_job_init: 00:00:00." in caplog.text
+    assert "(1 calls)" in caplog.text
+    assert "% of wall time" in caplog.text
+    assert " bytes of log text" in caplog.text
+    assert "exceeds the budget" not in caplog.text
+
+
+def test_overhead_budget(caplog):
+    from pipen_verbose import OVERHEAD_BUDGET_GRACE
+
+    plugin = PipenVerbose()
+    plugin.overhead_budget = 1.0
+    plugin.degraded = False
+    plugin.started = 0.0
+    plugin.overhead_total = 0.2
+    # in the grace period
+    plugin._check_overhead_budget(OVERHEAD_BUDGET_GRACE / 2)
+    assert not plugin.degraded
+    # within the budget
+    plugin._check_overhead_budget(100.0)
+    assert not plugin.degraded
+    plugin._check_overhead_budget(10.0)
+    assert plugin.degraded
+    assert "Overhead (2.00% of wall time) exceeds the budget (1.0%)" in caplog.text
+
+
+def test_overhead_degraded(make_pipen, caplog):
+    pipen = make_pipen(loglevel="debug", verbose_overhead_budget=0)
+    proc1 = Proc.from_proc(NormalProc, input_data=[1])
+    proc2 = Proc.from_proc(NormalProc, input_data=[2], requires=proc1)
+    pipen.set_starts(proc1)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr("pipen_verbose.OVERHEAD_BUDGET_GRACE", 0.0)
+        pipen.run()
+    assert "exceeds the budget" in caplog.text
+    assert "proc1:[/cyan] envs.x: 1" not in caplog.text
+    assert "proc2:[/cyan] Time elapsed" in caplog.text
+
+
+def test_profile(pipen, caplog):
+    proc = Proc.from_proc(
+        NormalProc,
+        input_data=[1],
+        plugin_opts={
+            "verbose_profile": True,
+            "verbose_tracemalloc": True,
+            "verbose_profile_top": 2,
+        },
+    )
+    pipen.set_starts(proc).run()
+    assert "verbose.prof, top functions" in caplog.text
+    assert "Top allocations" in caplog.text
+    workdir = Path(pipen.workdir) / "proc"
+    assert (workdir / "verbose.prof").is_file()
+    assert (workdir / "verbose.tracemalloc.txt").is_file()
+
+
+def test_memory(make_pipen, caplog):
+    pipen = make_pipen(
+        verbose_memory=True,
+        verbose_memory_gc=True,
+        verbose_memory_interval=0.01,
+    )
+    proc = Proc.from_proc(NormalProc, input_data=[1])
+    pipen.set_starts(proc).run()
+    assert "proc:[/cyan] Memory: " in caplog.text
+    assert "gc counts: (" in caplog.text
+    assert "Peak memory: " in caplog.text
+
+
+def test_cache_miss(caplog, tmp_path):
+    infiles = [tmp_path / "a.txt", tmp_path / "b.txt"]
+    for infile in infiles:
+        infile.write_text("a")
+
+    def run(envs):
+        pipen = Pipen(
+            name="pipeline_cache_miss",
+            cache=True,
+            plugins=[PipenVerbose],
+            outdir=tmp_path / "outdir",
+            workdir=tmp_path / "workdir",
+            plugin_opts={"verbose_metrics": str(tmp_path / "verbose.prom")},
+        )
+        proc = Proc.from_proc(
+            FileProc,
+            input_data=infiles,
+            envs=envs,
+            plugin_opts={"verbose_cache_miss": True},
+        )
+        caplog.clear()
+        pipen.set_starts(proc).run()
+
+    run({"x": 1})
+    assert "Cache misses: 2 job(s)" in caplog.text
+    assert "no previous run: 2 (e.g. 0-1)" in caplog.text
+
+    time.sleep(0.1)
+    infiles[1].write_text("b")
+    run({"x": 1})
+    assert "Cache misses: 1 job(s)" in caplog.text
+    assert "newer input file (a): 1 (e.g. 1)" in caplog.text
+
+    run({"x": 1})
+    assert "Cache misses" not in caplog.text
+    assert 'proc="proc",state="cached"} 2' in (tmp_path / "verbose.prom").read_text()
+
+    run({"x": 2})
+    assert "changed envs: 2 (e.g. 0-1)" in caplog.text
+
+
+@pytest.mark.parametrize("jsonl", [False, True])
+def test_retries(make_pipen, caplog, tmp_path, jsonl):
+    pipen = make_pipen(verbose_jsonl=jsonl and str(tmp_path / "verbose.jsonl"))
+    proc = Proc.from_proc(
+        FlakyProc,
+        input_data=[
+            (str(tmp_path / "a"), 1),
+            (str(tmp_path / "b"), 2),
+            (str(tmp_path / "c"), 3),
+        ],
+    )
+    pipen.set_starts(proc).run()
+    if not jsonl:
+        assert "Retried jobs: 2, retries: 3 (1x: 1, 2x: 1), " in caplog.text
+        assert "Retried jobs: 2 in proc, retries: 3, " in caplog.text
+        return
+
+    items = [
+        json.loads(line)
+        for line in (tmp_path / "verbose.jsonl").read_text().splitlines()
+    ]
+    retries = [item for item in items if item["kind"] == "retries"]
+    assert retries[0]["proc"] == "proc"
+    assert retries[0]["data"]["distribution"] == {"1": 1, "2": 1}
+    assert retries[1]["proc"] is None
+    assert retries[1]["data"]["procs"] == ["proc"]
+    assert retries[1]["data"]["wasted"] > 0
+
+
+def test_retries_missing_output(make_pipen, tmp_path):
+    pipen = make_pipen(verbose_jsonl=str(tmp_path / "verbose.jsonl"))
+    # the second attempt of job 1 exits 0, but the output is not generated
+    proc = Proc.from_proc(
+        FlakyMissingOutputProc,
+        input_data=[(str(tmp_path / "a"), 1), (str(tmp_path / "b"), 0)],
+    )
+    pipen.set_starts(proc).run()
+    items = [
+        json.loads(line)
+        for line in (tmp_path / "verbose.jsonl").read_text().splitlines()
+    ]
+    failure = [item for item in items if item["kind"] == "failure"]
+    assert failure[0]["data"]["failed_jobs"] == [1]
+    retries = [item for item in items if item["kind"] == "retries"]
+    assert retries[0]["data"]["jobs"] == 2
+    assert retries[0]["data"]["retries"] == 2
+    assert retries[0]["data"]["distribution"] == {"1": 2}
+    # the first attempts of both jobs, and the second attempt of job 1
+    assert retries[0]["data"]["wasted"] >= 0.6
+
+
+@pytest.mark.parametrize("jsonl", [False, True])
+def test_watchdog(make_pipen, caplog, tmp_path, jsonl):
+    pipen = make_pipen(
+        verbose_jsonl=jsonl and str(tmp_path / "verbose.jsonl"),
+        verbose_watchdog_size=100,
+        verbose_watchdog_rate=100,
+        verbose_watchdog_interval=0.1,
+    )
+    proc = Proc.from_proc(VerboseProc, input_data=[0, 1])
+    pipen.set_starts(proc).run()
+    if not jsonl:
+        assert "stdout is " in caplog.text
+        assert "larger than 100 B" in caplog.text
+        assert "stdout grows at " in caplog.text
+        return
+
+    items = [
+        json.loads(line)
+        for line in (tmp_path / "verbose.jsonl").read_text().splitlines()
+    ]
+    kinds = {item["data"]["kind"] for item in items if item["kind"] == "watchdog"}
+    assert kinds == {"size", "rate"}
+
+
+def test_metrics(make_pipen):
+    pipen = make_pipen(verbose_metrics=True, verbose_metrics_interval=0.01)
+    proc = Proc.from_proc(MultiJobProc, input_data=[0, 1])
+    pipen.set_starts(proc).run()
+    metrics = Path(pipen.workdir) / "verbose.prom"
+    content = metrics.read_text()
+    labels = f'pipeline="{pipen.name}",proc="proc"'
+    assert f'pipen_jobs_total{{{labels},state="init"}} 2' in content
+    assert f'pipen_jobs_total{{{labels},state="started"}} 2' in content
+    assert f'pipen_jobs_total{{{labels},state="succeeded"}} 1' in content
+    assert f'pipen_jobs_total{{{labels},state="failed"}} 1' in content
+    assert f"pipen_job_duration_seconds_count{{{labels}}} 2" in content
+    assert f'pipen_pipeline_running{{pipeline="{pipen.name}"}} 0' in content
+
+
+def test_metrics_missing_output(make_pipen, tmp_path):
+    pipen = make_pipen(verbose_metrics=True)
+    # the second attempt of job 1 exits 0, but the output is not generated
+    proc = Proc.from_proc(
+        FlakyMissingOutputProc,
+        input_data=[(str(tmp_path / "a"), 1), (str(tmp_path / "b"), 0)],
+    )
+    pipen.set_starts(proc).run()
+    content = (Path(pipen.workdir) / "verbose.prom").read_text()
+    labels = f'pipeline="{pipen.name}",proc="proc"'
+    assert f'pipen_jobs_total{{{labels},state="init"}} 2' in content
+    assert f'pipen_jobs_total{{{labels},state="started"}} 4' in content
+    assert f'pipen_jobs_total{{{labels},state="retried"}} 2' in content
+    assert f'pipen_jobs_total{{{labels},state="succeeded"}} 1' in content
+    assert f'pipen_jobs_total{{{labels},state="failed"}} 3' in content
+    assert f"pipen_job_duration_seconds_count{{{labels}}} 4" in content
+    assert f'pipen_pipeline_running{{pipeline="{pipen.name}"}} 0' in content
+
+
+def test_archive(make_pipen):
+    pipen = make_pipen(verbose_archive=True)
+    proc = Proc.from_proc(NormalProc, input_data=[1], envs={"x": "y" * 1000})
+    pipen.set_starts(proc).run()
+    # named by the run
+    (archive,) = Path(pipen.workdir).glob("verbose.archive.*.1.jsonl.gz")
+    content = gzip.decompress(archive.read_bytes())
+    items = [json.loads(line) for line in content.splitlines()]
+    kinds = [item["kind"] for item in items]
+    assert "log" in kinds
+    assert items[kinds.index("envs")]["data"] == {"x": "y" * 1000}
+    job = items[kinds.index("job")]
+    assert job["proc"] == "proc"
+    assert job["data"]["input"] == {"a": 1}
+
+
+@pytest.mark.parametrize("preflight", [True, "fail"])
+def test_preflight(make_pipen, caplog, tmp_path, preflight):
+    (tmp_path / "a.txt").write_text("a")
+    pipen = make_pipen()
+    proc = Proc.from_proc(
+        FileProc,
+        input_data=[tmp_path / "a.txt", tmp_path / "b.txt", tmp_path / "b.txt"],
+        envs={"x": 1},
+        plugin_opts={"verbose_preflight": preflight},
+    )
+    pipen.set_starts(proc)
+    if preflight == "fail":
+        with pytest.raises(Exception) as excinfo:
+            pipen.run()
+        assert isinstance(excinfo.value.__cause__, ProcInputValueError)
+        assert "Input preflight failed" in str(excinfo.value.__cause__)
+    else:
+        pipen.run()
+    assert "Input preflight: in.a missing in 2 job(s) (1-2), e.g. " in caplog.text
+
+
+def test_preflight_jsonl(make_pipen, tmp_path):
+    pipen = make_pipen(
+        verbose_jsonl=str(tmp_path / "verbose.jsonl"),
+        verbose_preflight=True,
+    )
+    (tmp_path / "a.txt").write_text("a")
+    proc = Proc.from_proc(FileProc, input_data=[tmp_path / "b.txt"], envs={"x": 1})
+    proc2 = Proc.from_proc(FileProc, input_data=[tmp_path / "a.txt"], envs={"x": 1})
+    pipen.set_starts(proc, proc2).run()
+    items = [
+        json.loads(line)
+        for line in (tmp_path / "verbose.jsonl").read_text().splitlines()
+    ]
+    preflight = [item for item in items if item["kind"] == "preflight"]
+    assert len(preflight) == 1
+    assert preflight[0]["level"] == "warning"
+    assert preflight[0]["data"] == [
+        {
+            "key": "a",
+            "problem": "missing",
+            "jobs": [0],
+            "example": str(tmp_path / "b.txt"),
+        }
+    ]
+
+
+@pytest.mark.parametrize("jsonl", [False, True])
+def test_output_scan(make_pipen, caplog, tmp_path, monkeypatch, jsonl):
+    checked = []
+    check_path = _InputPreflight._check_path
+
+    async def checking_path(self, spec, isdir):
+        checked.append(str(spec))
+        return await check_path(self, spec, isdir)
+
+    monkeypatch.setattr(_InputPreflight, "_check_path", checking_path)
+    pipen = make_pipen(
+        verbose_jsonl=jsonl and str(tmp_path / "verbose.jsonl"),
+        verbose_output_scan=True,
+        verbose_preflight=True,
+    )
+    proc = Proc.from_proc(OutputProc, input_data=[0, 1, 2])
+    proc2 = Proc.from_proc(FileProc, requires=proc, input_data=lambda ch: ch[["b"]])
+    pipen.set_starts(proc).run()
+    workdir = Path(pipen.workdir) / "proc"
+    outputs = json.loads((workdir / "verbose.outputs.json").read_text())
+    assert outputs[str(workdir / "0" / "output" / "b.txt")]["size"] == 0
+    assert outputs[str(workdir / "1" / "output" / "b.txt")]["size"] == 2
+    assert outputs[str(workdir / "1" / "output" / "c")]["size"] == 1
+    # the inputs of proc2 are found in the index of the outputs of proc
+    outdir2 = Path(pipen.outdir) / proc2.name
+    assert len(list(outdir2.glob("*/b.txt"))) == 3
+    assert checked == []
+    if not jsonl:
+        assert "Output scan: out.b empty in 1 job(s) (0)" in caplog.text
+        assert "older than" not in caplog.text
+        return
+
+    items = [
+        json.loads(line)
+        for line in (tmp_path / "verbose.jsonl").read_text().splitlines()
+    ]
+    scans = [item for item in items if item["kind"] == "output_scan"]
+    assert scans[0]["data"] == [{"key": "b", "problem": "empty", "jobs": [0]}]
+
+
+def test_output_scan_missing(tmp_path):
+    logs = []
+    proc = SimpleNamespace(
+        name="P",
+        workdir=SpecPath(tmp_path),
+        plugin_opts={},
+        log=lambda level, msg, *args, logger: logs.append(msg % args),
+        jobs=[
+            SimpleNamespace(
+                index=0,
+                _status=JobStatus.FINISHED,
+                _output_types={"b": "file"},
+                output={"b": SpecPath(tmp_path / "b.txt").mounted},
+            )
+        ],
+    )
+    plugin = PipenVerbose()
+    plugin.output_scans["P"] = _OutputScan()
+    asyncio.run(plugin._scan_outputs(proc))
+    assert logs == ["Output scan: out.b missing in 1 job(s) (0)"]
+    # the missing outputs are not cached by the preflight
+    assert plugin.preflight.fine == set()
+    assert json.loads((tmp_path / "verbose.outputs.json").read_text()) == {
+        str(tmp_path / "b.txt"): None
+    }
+
+
+@pytest.mark.parametrize("jsonl", [False, True])
+def test_prep(make_pipen, caplog, tmp_path, jsonl):
+    pipen = make_pipen(
+        verbose_jsonl=jsonl and str(tmp_path / "verbose.jsonl"),
+        verbose_archive=str(tmp_path / "archive"),
+    )
+    proc = Proc.from_proc(
+        MultiJobProc,
+        input_data=[0, 0, 0],
+        plugin_opts={"verbose_prep": True},
+    )
+    # without script
+    proc2 = Proc.from_proc(
+        NormalProc,
+        requires=proc,
+        input_data=lambda ch: [1],
+        plugin_opts={"verbose_prep": True},
+    )
+    pipen.set_starts(proc).run()
+    (archive_file,) = tmp_path.glob("archive.*.1.jsonl.gz")
+    archive = [
+        json.loads(line)
+        for line in gzip.decompress(archive_file.read_bytes()).splitlines()
+    ]
+    preps = [item for item in archive if item["kind"] == "prep"]
+    assert sorted(item["job"] for item in preps) == [0, 0, 1, 2]
+    assert all(item["data"]["prep"] > 0 for item in preps)
+    if not jsonl:
+        assert "Job preparation: p50 00:00:00." in caplog.text
+        assert "Script rendering: p50 00:00:00." in caplog.text
+        assert "Slowest jobs to prepare: " in caplog.text
+        return
+
+    items = [
+        json.loads(line)
+        for line in (tmp_path / "verbose.jsonl").read_text().splitlines()
+    ]
+    prep = [item for item in items if item["kind"] == "prep"]
+    assert prep[0]["data"]["jobs"] == 3
+    assert prep[1]["proc"] == proc2.name
+    assert prep[1]["data"]["render"] is None
+    assert len(prep[0]["data"]["slowest"]) == 3
+
+
+def test_rate_limit(make_pipen, caplog, tmp_path):
+    pipen = make_pipen(
+        loglevel="debug",
+        verbose_rate_limit=0.001,
+        verbose_rate_burst=3,
+        verbose_archive=str(tmp_path / "archive"),
+    )
+    proc = Proc.from_proc(
+        NormalProc,
+        input_data=[1, 2, 3],
+        envs={f"x{i}": i for i in range(5)},
+        plugin_opts={"verbose_jobs": "spread", "verbose_input_summary": True},
+    )
+    proc2 = Proc.from_proc(
+        NormalProc,
+        requires=proc,
+        input_data=lambda ch: [1, 2],
+        plugin_opts={"verbose_input_summary": True},
+    )
+    pipen.set_starts(proc).run()
+    # no tokens left for the second process
+    assert f"{proc2.name}:[/cyan] input summary: 1 keys, " in caplog.text
+    # the input summary, the props and the input of one job are allowed
+    assert "envs: 6 keys, " in caplog.text
+    assert "in: 2 keys of 2 job(s)" in caplog.text
+    assert "out: 3 keys of 3 job(s)" in caplog.text
+    assert "\u2014 suppressed, see archive" in caplog.text
+    assert "envs.x0" not in caplog.text
+    assert "Time elapsed" in caplog.text